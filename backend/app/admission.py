@@ -0,0 +1,239 @@
+"""
+Admission control in front of the inference pipeline
+Each user has a token bucket (ADMISSION_RATE per second, ADMISSION_BURST
+deep). Admitted work runs in at most ADMISSION_CONCURRENCY slots; once
+they are taken, waiting requests queue per user and are served round-robin
+across users, so one tenant's script cannot starve everyone else. A
+request whose estimated wait is over ADMISSION_MAX_WAIT is shed at once
+with a Retry-After instead of slowing every request down.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from fastapi import status
+
+from .config import settings
+from .metrics import ADMISSIONS
+from .ml.executor import inference_executor
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest observation in the service time moving average
+SERVICE_TIME_SMOOTHING = 0.2
+
+# Idle users with a full bucket are forgotten beyond this many tracked users
+MAX_TRACKED_USERS = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a user is over their rate or the queue wait is too long"""
+
+    def __init__(self, message: str, retry_after: float, status_code: int):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+
+
+class _UserState:
+    __slots__ = ("tokens", "updated", "waiting", "active", "counts")
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waiting: Deque[asyncio.Future] = deque()
+        self.active = 0
+        self.counts = {"admitted": 0, "queued": 0, "rejected": 0, "rate_limited": 0}
+
+
+class AdmissionController:
+    """
+    Token buckets, per-user fair queuing and deadline-based load shedding
+
+    Queue wait is estimated from the caller's position in the round-robin
+    order and a moving average of how long admitted work holds a slot.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 10, concurrency: int = 0, max_wait: float = 5.0):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency or 2 * inference_executor.workers
+        self.max_wait = max_wait
+        self._users: Dict[str, _UserState] = {}
+        # Users with waiting requests, in the order they will next be served
+        self._turns: "OrderedDict[str, None]" = OrderedDict()
+        self._active = 0
+        self._waiting = 0
+        self._service_time = 0.5
+
+    def _user(self, user_id: str) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            if len(self._users) >= MAX_TRACKED_USERS:
+                self._forget_idle_users()
+            state = self._users[user_id] = _UserState(self.burst)
+        return state
+
+    def _forget_idle_users(self):
+        now = time.monotonic()
+        idle = [
+            user_id for user_id, state in self._users.items()
+            if not state.active and not state.waiting
+            and (not self.rate or state.tokens + (now - state.updated) * self.rate >= self.burst)
+        ]
+        for user_id in idle:
+            del self._users[user_id]
+
+    def _count(self, state: _UserState, outcome: str):
+        state.counts[outcome] += 1
+        ADMISSIONS.inc(outcome=outcome)
+
+    def charge(self, user_id: str, cost: float = 1):
+        """
+        Take cost tokens from the user's bucket
+
+        Raises:
+            AdmissionRejected: 429 if the bucket does not hold enough tokens
+        """
+        if not self.rate or not cost:
+            return
+        state = self._user(user_id)
+        now = time.monotonic()
+        state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+
+        cost = min(cost, self.burst)
+        if state.tokens < cost:
+            self._count(state, "rate_limited")
+            raise AdmissionRejected(
+                f"Rate limit of {self.rate:g} verifications per second exceeded",
+                (cost - state.tokens) / self.rate,
+                status.HTTP_429_TOO_MANY_REQUESTS,
+            )
+        state.tokens -= cost
+
+    def estimated_wait(self, user_id: str) -> float:
+        """Seconds a new request from this user would wait for a slot"""
+        if self._active < self.concurrency and not self._waiting:
+            return 0.0
+        position = len(self._user(user_id).waiting)
+        # Round-robin: everyone else with queued work gets up to one turn per turn of ours
+        ahead = position + sum(
+            min(len(self._users[other].waiting), position + 1) for other in self._turns if other != user_id
+        )
+        return (ahead + 1) * self._service_time / self.concurrency
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, cost: float = 1, shed: bool = True):
+        """
+        Hold an inference slot for the duration of the with-block
+
+        Args:
+            cost: tokens taken from the user's bucket, 0 for work that was
+                charged earlier (e.g. when a job was submitted)
+            shed: reject instead of queueing past max_wait; background work
+                passes False and simply waits its turn
+
+        Raises:
+            AdmissionRejected: 429 when rate limited, 503 when shed
+        """
+        self.charge(user_id, cost)
+        state = self._user(user_id)
+
+        if self._active < self.concurrency and not self._waiting:
+            self._active += 1
+        else:
+            wait = self.estimated_wait(user_id)
+            if shed and wait > self.max_wait:
+                if self.rate and cost:
+                    # Shed requests don't count against the user's rate
+                    state.tokens = min(self.burst, state.tokens + min(cost, self.burst))
+                self._count(state, "rejected")
+                raise AdmissionRejected(
+                    f"Verification service is overloaded (estimated wait {wait:.1f}s)",
+                    wait,
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+            await self._wait_turn(user_id, state)
+
+        self._count(state, "admitted")
+        state.active += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            state.active -= 1
+            elapsed = time.monotonic() - started
+            self._service_time += SERVICE_TIME_SMOOTHING * (elapsed - self._service_time)
+            self._release()
+
+    async def _wait_turn(self, user_id: str, state: _UserState):
+        future = asyncio.get_running_loop().create_future()
+        state.waiting.append(future)
+        self._waiting += 1
+        self._turns.setdefault(user_id)
+        self._count(state, "queued")
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in state.waiting:
+                state.waiting.remove(future)
+                self._waiting -= 1
+                if not state.waiting:
+                    self._turns.pop(user_id, None)
+            elif not future.cancelled():
+                # The slot was handed over just as the caller went away
+                self._release()
+            raise
+
+    def _release(self):
+        """Hand the freed slot to the next user in turn, or give it back"""
+        while self._turns:
+            user_id, _ = self._turns.popitem(last=False)
+            state = self._users[user_id]
+            future = state.waiting.popleft()
+            self._waiting -= 1
+            if state.waiting:
+                # Back of the line until every other waiting user had a turn
+                self._turns[user_id] = None
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def user_stats(self, user_id: str) -> dict:
+        state = self._users.get(user_id)
+        if state is None:
+            return {"tokens": self.burst, "active": 0, "waiting": 0, "admitted": 0, "queued": 0, "rejected": 0, "rate_limited": 0}
+        tokens = min(self.burst, state.tokens + (time.monotonic() - state.updated) * self.rate)
+        return {
+            "tokens": round(tokens, 2),
+            "active": state.active,
+            "waiting": len(state.waiting),
+            **state.counts,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "waiting": self._waiting,
+            "waiting_users": len(self._turns),
+            "service_time_ms": round(self._service_time * 1000, 1),
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_wait": self.max_wait,
+            "users": len(self._users),
+        }
+
+
+admission = AdmissionController(
+    rate=settings.ADMISSION_RATE,
+    burst=settings.ADMISSION_BURST,
+    concurrency=settings.ADMISSION_CONCURRENCY,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+)
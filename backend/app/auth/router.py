@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
+import time
 from .utils import authenticate_user, create_access_token, get_current_user
+from .user_cache import user_cache
 from ..schemas import UserCreate, UserResponse
 from ..models import UserInDB
+from ..metrics import LOGIN_DURATION
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -17,37 +20,41 @@ class LoginRequest(BaseModel):
 @router.post("/signup", response_model=UserResponse)
 async def signup(user_data: UserCreate):
     """Create new user account"""
-    from ..database import user_exists, create_user
-    from .utils import get_password_hash
+    from ..database import find_user_conflict, create_user, duplicate_key_field
+    from pymongo.errors import DuplicateKeyError
+    from .utils import get_password_hash_async
     
     # Check if user already exists
-    if await user_exists(username=user_data.username):
+    conflict = await find_user_conflict(email=user_data.email, username=user_data.username)
+    if conflict:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
+            detail=f"{conflict.capitalize()} already registered"
         )
     
-    if await user_exists(email=user_data.email):
+    # Hash password
+    hashed_password = await get_password_hash_async(user_data.password)
+    
+    # Create user, the unique indexes catch a concurrent signup for the same name
+    try:
+        user = await create_user(
+            email=user_data.email,
+            username=user_data.username,
+            password_hash=hashed_password
+        )
+    except DuplicateKeyError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+            detail=f"{duplicate_key_field(e).capitalize()} already registered"
         )
-    
-    # Hash password
-    hashed_password = get_password_hash(user_data.password)
-    
-    # Create user
-    user = await create_user(
-        email=user_data.email,
-        username=user_data.username,
-        password_hash=hashed_password
-    )
+    user_cache.invalidate(user.username)
     
     return user
 
 @router.post("/login")
 async def login(login_data: LoginRequest):
     """Login user and return JWT token"""
+    started = time.perf_counter()
     try:
         user = await authenticate_user(login_data.username, login_data.password)
         if not user:
@@ -69,6 +76,8 @@ async def login(login_data: LoginRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Login failed"
         )
+    finally:
+        LOGIN_DURATION.observe(time.perf_counter() - started)
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: UserInDB = Depends(get_current_user)):
@@ -0,0 +1,82 @@
+"""
+In-process cache of authenticated users
+Saves the Mongo round trip that get_current_user would otherwise make on
+every request carrying a JWT.
+"""
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from ..config import settings
+from ..models import UserInDB
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    LRU of UserInDB keyed by the token subject (username)
+
+    Entries expire after `ttl_seconds`; call invalidate() whenever a user
+    document is updated or deleted so the change is seen immediately.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, username: str) -> Optional[UserInDB]:
+        """Cached user, or None on a miss or expired entry"""
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[username]
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(username)
+        self._hits += 1
+        return entry[1]
+
+    def put(self, username: str, user: UserInDB):
+        if self.max_entries <= 0:
+            return
+        self._entries[username] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self, username: str):
+        """Drop a user after their document changed or was deleted"""
+        if self._entries.pop(username, None) is not None:
+            self._invalidations += 1
+
+    def clear(self):
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+
+user_cache = UserCache(
+    max_entries=settings.USER_CACHE_SIZE,
+    ttl_seconds=settings.USER_CACHE_TTL,
+)
@@ -1,20 +1,40 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from ..config import settings
 from ..schemas import TokenData
-from ..database import get_user_by_username
+from ..database import get_user_by_username, update_user_password_hash
 from ..models import UserInDB
+from ..metrics import PASSWORD_HASH_REJECTED, stage
+from .user_cache import user_cache
 import logging
 
 
 logger = logging.getLogger(__name__)
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the
+# event loop; its size caps how many hashes run at once
+password_hash_pool = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt"
+)
+
+# Hashes running or waiting for a bcrypt thread. ThreadPoolExecutor queues
+# without limit, so beyond this a burst of logins is turned away at once
+# instead of every caller waiting out the whole backlog
+_password_hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
@@ -45,6 +65,38 @@ def get_password_hash(password: str) -> str:
         logger.error(f"Password hashing error: {e}")
         raise
 
+def needs_rehash(hashed_password: str) -> bool:
+    """True if a bcrypt hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+
+async def _run_password_hash(fn, *args):
+    """Run fn on the bcrypt thread pool, 503 if its queue is full"""
+    if _password_hash_slots.locked():
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    async with _password_hash_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_hash_pool, fn, *args)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bcrypt thread pool"""
+    return await _run_password_hash(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the bcrypt thread pool"""
+    return await _run_password_hash(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -76,11 +128,26 @@ async def authenticate_user(username: str, password: str):
                     self.__dict__.update(data)
             user = UserObj(user)
         
-        if not verify_password(password, user.password_hash):
+        with stage("password_verify"):
+            valid = await verify_password_async(password, user.password_hash)
+        if not valid:
             logger.warning(f"Invalid password for user: {username}")
             return False
         
+        # Transparently upgrade hashes made with an older cost factor
+        if needs_rehash(user.password_hash):
+            try:
+                new_hash = await get_password_hash_async(password)
+                await update_user_password_hash(username, new_hash)
+                user_cache.invalidate(username)
+                logger.info(f"Rehashed password for user {username} with cost {settings.BCRYPT_ROUNDS}")
+            except Exception as e:
+                logger.warning(f"Could not rehash password for user {username}: {e}")
+        
         return user
+    except HTTPException:
+        # A full bcrypt queue is a 503, not a wrong password
+        raise
     except Exception as e:
         logger.error(f"Authentication error: {e}")
         return False
@@ -105,9 +172,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         logger.error(f"JWT decode error: {e}")
         raise credentials_exception
     
-    user = await get_user_by_username(username)
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    
+    with stage("auth_lookup"):
+        user = await get_user_by_username(username)
     
     if user is None:
         raise credentials_exception
     
+    user_cache.put(username, user)
     return user
\ No newline at end of file
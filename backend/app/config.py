@@ -16,13 +16,89 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    USER_CACHE_SIZE: int = 1024  # Authenticated users kept in memory, 0 disables
+    USER_CACHE_TTL: float = 60.0  # Seconds before a cached user is re-read
+    
+    # Password Hashing Configuration
+    BCRYPT_ROUNDS: int = 12  # Cost factor, existing hashes are upgraded on login
+    PASSWORD_HASH_WORKERS: int = 4  # Threads hashing/verifying passwords at once
+    PASSWORD_HASH_QUEUE_SIZE: int = 32  # Further hashes allowed to wait, beyond that logins get 503
     
     # File Upload Configuration
     UPLOAD_DIR: str = "uploads"
-    MAX_FILE_SIZE: int = 5 * 1024 * 1024  # 5MB
+    MAX_FILE_SIZE: int = 5 * 1024 * 1024  # 5MB per image, reading stops once exceeded
+    MAX_IMAGE_PIXELS: int = 40_000_000  # Width x height read from the image header
+    MAX_REQUEST_SIZE: int = 12 * 1024 * 1024  # Whole request body, keep above 2 x MAX_FILE_SIZE
+    MAX_BATCH_REQUEST_SIZE: int = 512 * 1024 * 1024  # Body limit of /verify/batch and /gallery/enroll
+    PERSIST_UPLOADS: bool = True  # Save uploads for auditing after the response
+    BATCH_MAX_PAIRS: int = 5000  # Pairs accepted by one /verify/batch request
+    
+    # Embedding Backend Configuration
+    EMBEDDING_BACKEND: str = "dlib"  # dlib (fast, 128-d) or facenet512 (ONNX, 512-d)
+    VERIFICATION_THRESHOLD: float = 0.0  # Match distance, 0 = backend default (dlib 0.6, facenet512 1.04)
+    FACENET_MODEL_PATH: str = "models/facenet512.onnx"
+    FACENET_THREADS: int = 1  # ONNX Runtime threads per inference worker
+    
+    # Write-Behind Persistence of Verification Records
+    WRITE_BEHIND: bool = False  # Buffer history inserts instead of awaiting each one
+    WRITE_BEHIND_QUEUE_SIZE: int = 10000
+    WRITE_BEHIND_BATCH_SIZE: int = 200  # Flush once this many records are queued...
+    WRITE_BEHIND_FLUSH_MS: float = 500.0  # ...or once the oldest has waited this long
+    WRITE_BEHIND_SPILL_DIR: str = "spill"  # Records that cannot be queued or inserted
+    
+    # Inference Executor Configuration
+    INFERENCE_WORKERS: int = 0  # 0 = one worker process per CPU core
+    INFERENCE_QUEUE_SIZE: int = 32  # Jobs allowed to wait for a free worker
+    INFERENCE_TIMEOUT: float = 30.0  # Seconds per verification job
+    
+    # Admission Control (per-user rate limits and fair queuing for inference)
+    ADMISSION_RATE: float = 2.0  # Verifications per second each user may sustain, 0 disables rate limiting
+    ADMISSION_BURST: int = 10  # Requests a user may send at once before the rate applies
+    ADMISSION_CONCURRENCY: int = 0  # Admitted verifications in flight, 0 = 2 x inference workers
+    ADMISSION_MAX_WAIT: float = 5.0  # Seconds of estimated queue wait before requests are shed with 503
+    
+    # Multi-Frame Verification (/verify/frames)
+    MULTIFRAME_MAX_FRAMES: int = 64  # Frames accepted per request, uploaded one by one or in an animated clip
+    MULTIFRAME_MAX_REQUEST_SIZE: int = 32 * 1024 * 1024  # Body limit of /verify/frames, also caps the clip
+    MULTIFRAME_MAX_CLIP_PIXELS: int = 100_000_000  # Width x height x frames of a clip, all of which may be decoded
+    MULTIFRAME_MIN_FRAMES: int = 2  # Frames encoded before the decision may stop early
+    MULTIFRAME_CONFIDENCE_Z: float = 2.0  # Stop once the mean distance is this many standard errors from the threshold
+    
+    # Asynchronous Verification Jobs (/verify/jobs)
+    JOB_WORKERS: int = 0  # Jobs verified concurrently, 0 = 2 x inference workers
+    JOB_QUEUE_SIZE: int = 256  # Accepted jobs waiting to run, their images are held in memory
+    JOB_RETENTION_HOURS: float = 24.0  # Job documents expire this long after submission
+    
+    # Pre-Fork Serving (python -m app.serve)
+    SERVE_WORKERS: int = 1  # HTTP worker processes forked after the models are loaded
+    
+    # Startup Configuration
+    STARTUP_BUDGET_SECONDS: float = 20.0  # Import + model warm-up time above this is logged as a warning
+    WARMUP_TIMEOUT: float = 300.0  # Give up on warm-up (and stay unready) after this many seconds
+    
+    # Image Preprocessing
+    # Off until the FG-NET evaluation shows no accuracy loss on small faces (e.g. 1280 / 640)
+    DECODE_MAX_SIDE: int = 0  # JPEGs are draft-decoded down towards this, 0 = full size
+    DETECT_MAX_SIDE: int = 0  # Face detection runs on a copy this large, 0 = full size
+    FACE_SELECTION: str = "largest"  # Primary face policy: largest, central or score
+    
+    # Encoding Micro-Batching
+    ENCODE_BATCH_SIZE: int = 16  # Faces per batched encoder call
+    ENCODE_BATCH_WINDOW_MS: float = 5.0  # Max time a face waits for batch-mates
+    
+    # Age Estimation (exported ResNet50 regressor, needs onnxruntime)
+    AGE_MODEL_PATH: str = ""  # ONNX model from app.ml.age_export, empty disables
+    AGE_THREADS: int = 1  # ONNX Runtime threads per inference worker
+    
+    # Embedding Cache Configuration
+    EMBEDDING_CACHE_SIZE: int = 1024  # In-memory entries, 0 disables the cache
+    EMBEDDING_CACHE_TTL: float = 3600.0  # Seconds
+    EMBEDDING_CACHE_DIR: str = ""  # Optional on-disk tier, empty = memory only
     
-    # DeepFace Model Configuration
-    DEEPFACE_MODEL: str = "Facenet512"
-    VERIFICATION_THRESHOLD: float = 0.4
+    # Gallery (1:N identification) Configuration
+    GALLERY_DIR: str = "gallery"  # One memory-mapped index per user below this
+    GALLERY_TOP_K: int = 5
+    GALLERY_MAX_ENROLL_IMAGES: int = 20  # Images accepted per /gallery/enroll request
+    GALLERY_MATCH_THRESHOLD: float = 0.0  # Distance between L2-normalized encodings, 0 = backend default
 
 settings = Settings()
\ No newline at end of file
@@ -1,7 +1,14 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ConnectionFailure
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure
 from .config import settings
-from typing import Optional
+from .metrics import stage
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+import base64
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,6 +28,8 @@ async def connect_to_mongo():
     except ConnectionFailure as e:
         logger.error(f"Could not connect to MongoDB: {e}")
         raise
+    
+    await ensure_indexes()
 
 async def close_mongo_connection():
     """Close MongoDB connection"""
@@ -35,6 +44,44 @@ def get_database():
 # Collection names
 USERS_COLLECTION = "users"
 VERIFICATION_HISTORY_COLLECTION = "verification_history"
+VERIFICATION_JOBS_COLLECTION = "verification_jobs"
+VERIFICATION_STATS_COLLECTION = "verification_stats"
+
+# Indexes the hot queries rely on: collection -> [(name, keys, options)]
+INDEXES = {
+    USERS_COLLECTION: [
+        ("username_unique", [("username", ASCENDING)], {"unique": True}),
+        ("email_unique", [("email", ASCENDING)], {"unique": True}),
+    ],
+    VERIFICATION_HISTORY_COLLECTION: [
+        # Serves history filtering, sorting and keyset pagination on (created_at, _id)
+        ("user_id_created_at_id", [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+    ],
+    VERIFICATION_JOBS_COLLECTION: [
+        ("user_id_created_at", [("user_id", ASCENDING), ("created_at", DESCENDING)], {}),
+        # Mongo's TTL monitor removes old jobs, finished or not
+        ("created_at_ttl", [("created_at", ASCENDING)], {"expireAfterSeconds": int(settings.JOB_RETENTION_HOURS * 3600)}),
+    ],
+}
+
+async def ensure_indexes():
+    """Create missing indexes and check that all of them exist"""
+    db = get_database()
+    
+    for collection, indexes in INDEXES.items():
+        for name, keys, options in indexes:
+            try:
+                await db[collection].create_index(keys, name=name, **options)
+            except OperationFailure as e:
+                # e.g. duplicate usernames already stored, or a conflicting index
+                logger.error(f"Could not create index {collection}.{name}: {e}")
+        
+        existing = await db[collection].index_information()
+        missing = [name for name, _, _ in indexes if name not in existing]
+        if missing:
+            logger.warning(f"Missing indexes on {collection}: {', '.join(missing)}")
+        else:
+            logger.info(f"Indexes on {collection} verified")
 
 
 # ============= DATABASE OPERATIONS =============
@@ -49,15 +96,6 @@ async def get_user_by_username(username: str):
         return UserInDB(**user_dict)
     return None
 
-async def get_user_by_email(email: str):
-    """Get user by email"""
-    from .models import UserInDB
-    db = get_database()
-    user_dict = await db[USERS_COLLECTION].find_one({"email": email})
-    if user_dict:
-        return UserInDB(**user_dict)
-    return None
-
 async def create_user(email: str, username: str, password_hash: str):
     """Create a new user"""
     from .models import UserInDB
@@ -72,35 +110,54 @@ async def create_user(email: str, username: str, password_hash: str):
         "created_at": datetime.utcnow()
     }
     
+    # Raises DuplicateKeyError if the username or email was taken concurrently
     result = await db[USERS_COLLECTION].insert_one(user_dict)
     user_dict["_id"] = result.inserted_id
     
     return UserInDB(**user_dict)
 
-async def user_exists(email: str = None, username: str = None) -> bool:
-    """Check if user exists"""
+async def update_user_password_hash(username: str, password_hash: str):
+    """Replace a user's password hash"""
     db = get_database()
-    query = {}
-    if email:
-        query["email"] = email
-    if username:
-        query["username"] = username
-    
-    if not query:
-        return False
+    await db[USERS_COLLECTION].update_one(
+        {"username": username},
+        {"$set": {"password_hash": password_hash}}
+    )
+
+async def find_user_conflict(email: str, username: str) -> Optional[str]:
+    """
+    Check username and email availability in a single query
     
-    user = await db[USERS_COLLECTION].find_one(query)
-    return user is not None
+    Returns:
+        "username" or "email" for the field that is already registered, else None
+    """
+    db = get_database()
+    user = await db[USERS_COLLECTION].find_one(
+        {"$or": [{"username": username}, {"email": email}]},
+        projection={"username": 1}
+    )
+    if user is None:
+        return None
+    return "username" if user["username"] == username else "email"
+
+def duplicate_key_field(error: DuplicateKeyError) -> str:
+    """Which unique field a DuplicateKeyError from the users collection is about"""
+    key_pattern = (error.details or {}).get("keyPattern", {})
+    return "email" if "email" in key_pattern else "username"
 
 
 # VERIFICATION OPERATIONS
 async def create_verification_record(user_id: str, image1_filename: str, image2_filename: str, result: str, confidence_score: float):
-    """Create a new verification record"""
-    from datetime import datetime
+    """
+    Create a new verification record
     
-    db = get_database()
+    The _id is generated client-side, so with WRITE_BEHIND enabled the
+    record is only queued and the caller does not wait for Mongo.
+    """
+    from .write_behind import verification_writer
     
     verification_dict = {
+        "_id": ObjectId(),
         "user_id": user_id,
         "image1_filename": image1_filename,
         "image2_filename": image2_filename,
@@ -109,27 +166,203 @@ async def create_verification_record(user_id: str, image1_filename: str, image2_
         "created_at": datetime.utcnow()
     }
     
-    result = await db[VERIFICATION_HISTORY_COLLECTION].insert_one(verification_dict)
-    verification_dict["_id"] = result.inserted_id
+    if verification_writer.running:
+        await verification_writer.put(verification_dict)
+        logger.info(f"Queued verification record: {verification_dict['_id']}")
+        return verification_dict
+    
+    db = get_database()
+    await db[VERIFICATION_HISTORY_COLLECTION].insert_one(verification_dict)
+    await update_verification_stats([verification_dict])
     
-    logger.info(f"Created verification record: {result.inserted_id}")
+    logger.info(f"Created verification record: {verification_dict['_id']}")
     
     return verification_dict
 
-async def get_user_verification_history(user_id: str, limit: int = 50):
-    """Get verification history for a user"""
+async def create_verification_records(records: list):
+    """Bulk-insert verification records that already carry their own _id"""
+    if not records:
+        return
+    
+    db = get_database()
+    try:
+        with stage("db_insert_many"):
+            result = await db[VERIFICATION_HISTORY_COLLECTION].insert_many(records, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: everything outside writeErrors was stored and still counts
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        await update_verification_stats([record for index, record in enumerate(records) if index not in failed])
+        raise
+    await update_verification_stats(records)
+    logger.info(f"Created {len(result.inserted_ids)} verification records")
+
+# VERIFICATION STATS OPERATIONS
+# One summary document per user (_id = user_id), kept up to date as
+# history records are inserted so GET /verify/stats never scans history:
+# {total, results: {match, no_match}, confidence_sum,
+#  confidence_histogram: {"0".."9": count}, first_at, last_at}
+VERIFICATION_RESULTS = ("match", "no_match")
+CONFIDENCE_BUCKETS = 10  # Histogram buckets of width 1 / CONFIDENCE_BUCKETS
+
+def confidence_bucket(confidence: float) -> int:
+    """Histogram bucket of a confidence score, 1.0 falls into the last one"""
+    return max(0, min(int(confidence * CONFIDENCE_BUCKETS), CONFIDENCE_BUCKETS - 1))
+
+def _stats_updates(records: Iterable[dict]) -> List[UpdateOne]:
+    """One upsert per user adding the records' counts to their summary"""
+    updates: Dict[str, dict] = {}
+    for record in records:
+        update = updates.setdefault(record["user_id"], {"$inc": {}, "$min": {}, "$max": {}})
+        inc = update["$inc"]
+        for field, amount in (
+            ("total", 1),
+            (f"results.{record['result']}", 1),
+            (f"confidence_histogram.{confidence_bucket(record['confidence_score'])}", 1),
+            ("confidence_sum", record["confidence_score"]),
+        ):
+            inc[field] = inc.get(field, 0) + amount
+        created_at = record["created_at"]
+        update["$min"]["first_at"] = min(update["$min"].get("first_at", created_at), created_at)
+        update["$max"]["last_at"] = max(update["$max"].get("last_at", created_at), created_at)
+    return [UpdateOne({"_id": user_id}, update, upsert=True) for user_id, update in updates.items()]
+
+async def update_verification_stats(records: list):
+    """
+    Add newly stored history records to their users' summaries
+    
+    Best effort: a failure is logged and the request still succeeds, since
+    rebuild_verification_stats() recomputes every summary from history.
+    """
+    db = get_database()
+    try:
+        updates = _stats_updates(records)
+        if updates:
+            with stage("db_stats_update"):
+                await db[VERIFICATION_STATS_COLLECTION].bulk_write(updates, ordered=False)
+    except Exception as e:
+        logger.error(f"Could not update verification stats for {len(records)} records: {e}")
+
+async def get_verification_stats(user_id: str) -> Optional[dict]:
+    """A user's summary document, None if they have no history"""
+    db = get_database()
+    return await db[VERIFICATION_STATS_COLLECTION].find_one({"_id": user_id})
+
+async def rebuild_verification_stats() -> int:
+    """
+    Recompute every user's summary from the full history in one aggregation
+    
+    $out swaps the new collection in atomically. Records inserted while the
+    pipeline runs may be missing from the result, so run it when traffic is
+    low (or run it again).
+    
+    Returns:
+        int: number of users summarised
+    """
+    bucket = {"$toString": {"$max": [0, {"$min": [
+        CONFIDENCE_BUCKETS - 1,
+        {"$toInt": {"$floor": {"$multiply": ["$confidence_score", CONFIDENCE_BUCKETS]}}}
+    ]}]}}
+    pipeline = [
+        # Per user and bucket first, so the histogram can be built with $arrayToObject
+        {"$group": {
+            "_id": {"user_id": "$user_id", "bucket": bucket},
+            "count": {"$sum": 1},
+            **{
+                result: {"$sum": {"$cond": [{"$eq": ["$result", result]}, 1, 0]}}
+                for result in VERIFICATION_RESULTS
+            },
+            "confidence_sum": {"$sum": "$confidence_score"},
+            "first_at": {"$min": "$created_at"},
+            "last_at": {"$max": "$created_at"},
+        }},
+        {"$group": {
+            "_id": "$_id.user_id",
+            "total": {"$sum": "$count"},
+            **{result: {"$sum": f"${result}"} for result in VERIFICATION_RESULTS},
+            "confidence_sum": {"$sum": "$confidence_sum"},
+            "histogram": {"$push": {"k": "$_id.bucket", "v": "$count"}},
+            "first_at": {"$min": "$first_at"},
+            "last_at": {"$max": "$last_at"},
+        }},
+        {"$project": {
+            "total": 1,
+            "results": {result: f"${result}" for result in VERIFICATION_RESULTS},
+            "confidence_sum": 1,
+            "confidence_histogram": {"$arrayToObject": "$histogram"},
+            "first_at": 1,
+            "last_at": 1,
+        }},
+        {"$out": VERIFICATION_STATS_COLLECTION},
+    ]
+    
+    db = get_database()
+    await db[VERIFICATION_HISTORY_COLLECTION].aggregate(pipeline).to_list(length=None)
+    count = await db[VERIFICATION_STATS_COLLECTION].count_documents({})
+    logger.info(f"Rebuilt verification stats for {count} users")
+    return count
+
+# Fields a history client may ask for; _id and created_at are always returned
+HISTORY_FIELDS = {"user_id", "image1_filename", "image2_filename", "result", "confidence_score", "created_at"}
+
+def encode_history_cursor(doc: dict) -> str:
+    """Opaque continuation token pointing just past a history document"""
+    payload = json.dumps({"t": doc["created_at"].isoformat(), "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_history_cursor(token: str) -> tuple:
+    """
+    Inverse of encode_history_cursor
+    
+    Raises:
+        ValueError: if the token is malformed
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid history cursor: {e}")
+
+def _history_query(user_id: str, after: Optional[tuple] = None) -> dict:
+    query = {"user_id": user_id}
+    if after:
+        created_at, doc_id = after
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": doc_id}}
+        ]
+    return query
+
+def _history_projection(fields: Optional[Iterable[str]]) -> Optional[dict]:
+    if not fields:
+        return None
+    projection = {field: 1 for field in fields}
+    projection["created_at"] = 1
+    return projection
+
+async def get_user_verification_history(
+    user_id: str,
+    limit: int = 50,
+    after: Optional[tuple] = None,
+    fields: Optional[Iterable[str]] = None
+):
+    """
+    Get verification history for a user, newest first
+    
+    Args:
+        after: (created_at, _id) of the last document of the previous page,
+            as returned by decode_history_cursor
+        fields: Subset of HISTORY_FIELDS to return (default: all)
+    """
     db = get_database()
     
     try:
         cursor = db[VERIFICATION_HISTORY_COLLECTION].find(
-            {"user_id": user_id}
-        ).sort("created_at", -1).limit(limit)
+            _history_query(user_id, after),
+            projection=_history_projection(fields)
+        ).sort([("created_at", -1), ("_id", -1)]).limit(limit)
         
-        verifications = []
-        async for doc in cursor:
-            # Convert ObjectId to string
-            doc['_id'] = str(doc['_id'])
-            verifications.append(doc)
+        verifications = await cursor.to_list(length=limit)
         
         logger.info(f"Retrieved {len(verifications)} verifications for user {user_id}")
         return verifications
@@ -138,8 +371,69 @@ async def get_user_verification_history(user_id: str, limit: int = 50):
         logger.error(f"Error getting verification history: {e}")
         raise
 
+async def iter_user_verification_history(
+    user_id: str,
+    fields: Optional[Iterable[str]] = None,
+    batch_size: int = 500
+) -> AsyncIterator[dict]:
+    """Yield a user's whole history, newest first, one cursor batch in memory at a time"""
+    db = get_database()
+    cursor = db[VERIFICATION_HISTORY_COLLECTION].find(
+        {"user_id": user_id},
+        projection=_history_projection(fields)
+    ).sort([("created_at", -1), ("_id", -1)]).batch_size(batch_size)
+    
+    async for doc in cursor:
+        yield doc
+
 async def delete_user_verification_history(user_id: str):
     """Delete all verifications for a user"""
     db = get_database()
     result = await db[VERIFICATION_HISTORY_COLLECTION].delete_many({"user_id": user_id})
-    logger.info(f"Deleted {result.deleted_count} verifications for user {user_id}")
\ No newline at end of file
+    await db[VERIFICATION_STATS_COLLECTION].delete_one({"_id": user_id})
+    logger.info(f"Deleted {result.deleted_count} verifications for user {user_id}")
+
+
+# VERIFICATION JOB OPERATIONS
+async def create_verification_job(user_id: str, image1_filename: str, image2_filename: str, priority: int):
+    """Insert a queued verification job and return its document"""
+    job = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "status": "queued",
+        "priority": priority,
+        "image1_filename": image1_filename,
+        "image2_filename": image2_filename,
+        "created_at": datetime.utcnow(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None
+    }
+    db = get_database()
+    await db[VERIFICATION_JOBS_COLLECTION].insert_one(job)
+    return job
+
+async def get_verification_job(job_id: str, user_id: str) -> Optional[dict]:
+    """A user's job by id, None if it does not exist, belongs to someone else or the id is malformed"""
+    try:
+        object_id = ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+    db = get_database()
+    return await db[VERIFICATION_JOBS_COLLECTION].find_one({"_id": object_id, "user_id": user_id})
+
+async def update_verification_job(job_id: ObjectId, **fields):
+    """Set fields (status, timestamps, result or error) on a job"""
+    db = get_database()
+    await db[VERIFICATION_JOBS_COLLECTION].update_one({"_id": job_id}, {"$set": fields})
+
+async def fail_verification_jobs(job_ids: list, error: str):
+    """Mark unfinished jobs as failed, e.g. when the server stops before running them"""
+    if not job_ids:
+        return
+    db = get_database()
+    await db[VERIFICATION_JOBS_COLLECTION].update_many(
+        {"_id": {"$in": job_ids}, "status": {"$in": ["queued", "running"]}},
+        {"$set": {"status": "failed", "error": error, "finished_at": datetime.utcnow()}}
+    )
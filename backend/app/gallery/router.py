@@ -0,0 +1,126 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from typing import List
+from pathlib import Path
+import asyncio
+import logging
+from ..schemas import GalleryEnrollResult, GalleryIdentifyResult, GalleryMatch
+from ..models import UserInDB
+from ..auth.utils import get_current_user
+from ..admission import admission
+from ..ml.backends import get_backend, gallery_threshold
+from ..ml.executor import inference_executor
+from ..ml.face_index import get_face_index
+from ..ml.pipeline import get_face_encoding
+from ..verification.router import read_image_upload, inference_errors
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/gallery", tags=["gallery"])
+
+GALLERY_DIR = Path(settings.GALLERY_DIR)
+
+def user_gallery(current_user: UserInDB):
+    """Each user enrolls into and identifies against their own index, one per backend"""
+    backend = get_backend()
+    # dlib indexes keep the layout from before backends were pluggable
+    directory = GALLERY_DIR if backend.name == "dlib" else GALLERY_DIR / backend.name
+    return get_face_index(str(directory / str(current_user.id)), backend.dimension)
+
+@router.post("/enroll", response_model=GalleryEnrollResult)
+async def enroll(
+    person_id: str = Form(..., min_length=1, max_length=64),
+    images: List[UploadFile] = File(...),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Add one or more face images of a person to the gallery"""
+    if len(images) > settings.GALLERY_MAX_ENROLL_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.GALLERY_MAX_ENROLL_IMAGES} images are accepted per request"
+        )
+    contents = [await read_image_upload(image) for image in images]
+
+    user_id = str(current_user.id)
+    # Keep the executor busy without overflowing its submission queue
+    limit = asyncio.Semaphore(inference_executor.workers * 2)
+
+    async def encode(data: bytes):
+        async with limit:
+            # Charged up front, each image then waits its fair turn
+            async with admission.admit(user_id, cost=0, shed=False):
+                return await get_face_encoding(data)
+
+    with inference_errors():
+        admission.charge(user_id, cost=len(contents))
+        encodings = await asyncio.gather(*(encode(data) for data in contents))
+
+    found = [encoding for encoding in encodings if encoding is not None]
+    skipped = [image.filename for image, encoding in zip(images, encodings) if encoding is None]
+    if not found:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No face detected in any of the images"
+        )
+
+    index = user_gallery(current_user)
+    enrolled = await run_in_threadpool(index.add, person_id, found)
+    logger.info(f"Enrolled {enrolled} encodings for {person_id} (user {current_user.id})")
+
+    return GalleryEnrollResult(
+        person_id=person_id,
+        enrolled=enrolled,
+        skipped=skipped,
+        total_encodings=len(index)
+    )
+
+@router.post("/identify", response_model=GalleryIdentifyResult)
+async def identify(
+    image: UploadFile = File(...),
+    top_k: int = Form(settings.GALLERY_TOP_K, ge=1, le=100),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Return the enrolled identities closest to the face in the probe image"""
+    probe = await read_image_upload(image)
+
+    with inference_errors():
+        async with admission.admit(str(current_user.id)):
+            encoding = await get_face_encoding(probe)
+
+    if encoding is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No face detected in the probe image"
+        )
+
+    index = user_gallery(current_user)
+    # Scoring scans the whole memory-mapped index, keep it off the event loop
+    found = await run_in_threadpool(index.search, encoding, top_k)
+    matches = [
+        GalleryMatch(
+            person_id=match["label"],
+            result="match" if match["distance"] < gallery_threshold() else "no_match",
+            similarity=match["similarity"],
+            distance=match["distance"],
+            confidence_score=max(0.0, min(1.0, match["similarity"]))
+        )
+        for match in found
+    ]
+
+    return GalleryIdentifyResult(matches=matches, gallery_size=len(index))
+
+@router.get("/")
+async def list_gallery(current_user: UserInDB = Depends(get_current_user)):
+    """List enrolled person ids with their number of encodings"""
+    return user_gallery(current_user).labels()
+
+@router.delete("/{person_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_person(person_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Remove every encoding of a person from the gallery"""
+    removed = await run_in_threadpool(user_gallery(current_user).remove, person_id)
+    if not removed:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Person not found in gallery"
+        )
+    return None
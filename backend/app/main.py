@@ -1,10 +1,30 @@
-from fastapi import FastAPI
+import time
+
+# Measured from here so the cold-start log covers the app's own imports
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from .database import connect_to_mongo, close_mongo_connection
 from .auth.router import router as auth_router
 from .verification.router import router as verify_router
+from .gallery.router import router as gallery_router
+from .ml.executor import inference_executor
+from .ml.batcher import age_batcher, encoding_batcher
+from .ml.embedding_cache import embedding_cache
+from .ml.backends import verification_threshold
+from .ml.model_loader import report_warm_worker
+from .auth.user_cache import user_cache
+from .auth.utils import password_hash_pool
+from .uploads import RequestSizeLimit
+from .admission import admission
+from .verification.jobs import verification_jobs
+from .write_behind import verification_writer
+from .metrics import registry, REQUEST_DURATION
 from .config import settings
+import asyncio
 import logging
 import os
 
@@ -15,6 +35,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Embedding backend description and encode cost, reported by a worker at startup
+embedding_backend = {}
+
+# Flipped by warm_up_models(); /ready answers 503 until then
+readiness = {
+    "ready": False,
+    "error": None,
+    "import_ms": round((time.perf_counter() - _import_started) * 1000, 1),
+    "warmup_ms": None,
+    "workers_warm": 0,
+}
+
+async def warm_up_models():
+    """Wait until every inference worker has loaded and warmed up the models, then mark the app ready"""
+    started = time.perf_counter()
+    deadline = started + settings.WARMUP_TIMEOUT
+    warm = set()
+    try:
+        # Workers only take jobs once their initializer has warmed them up;
+        # keep asking until every worker has answered at least once
+        while len(warm) < inference_executor.workers:
+            reports = await asyncio.gather(*(
+                inference_executor.run(report_warm_worker, timeout=max(deadline - time.perf_counter(), 0.001))
+                for _ in range(inference_executor.workers)
+            ))
+            for pid, report in reports:
+                warm.add(pid)
+                embedding_backend.update(report)
+            readiness["workers_warm"] = len(warm)
+    except Exception as e:
+        readiness["error"] = f"Model warm-up failed: {e}"
+        logger.error(f"⚠ {readiness['error']}")
+        return
+    
+    readiness["warmup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    readiness["ready"] = True
+    cold_start = (readiness["import_ms"] + readiness["warmup_ms"]) / 1000
+    logger.info(
+        f"✓ Models ready: imports {readiness['import_ms']:.0f}ms, "
+        f"warm-up of {len(warm)} workers {readiness['warmup_ms']:.0f}ms ({embedding_backend})"
+    )
+    if cold_start > settings.STARTUP_BUDGET_SECONDS:
+        logger.warning(
+            f"⚠ Cold start took {cold_start:.1f}s, over the {settings.STARTUP_BUDGET_SECONDS:.0f}s budget"
+        )
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -22,24 +88,32 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Face Verification API")
     logger.info("=" * 60)
     
-    # Connect to MongoDB
+    # Start inference worker processes, each one loads and warms up the
+    # models on a sample image so the first request does not pay for it.
+    # Warm-up runs in the background: non-ML endpoints serve right away
+    # and /ready reports when verification is warm. Started before Mongo
+    # connects so forked workers never inherit Motor's threads.
+    inference_executor.start()
+    logger.info(f"✓ Inference workers: {inference_executor.workers} ({inference_executor.start_method})")
+    
+    # Connect to MongoDB (after a pre-fork master forked this process)
     logger.info("Connecting to MongoDB...")
     await connect_to_mongo()
     logger.info("✓ Database connected")
     
-    # Preload ML model to avoid timeout on first request
-    logger.info("Preloading ML model...")
-    try:
-        from .ml.model_loader import preload_model
-        preload_model()
-        logger.info("✓ ML model preloaded successfully")
-    except Exception as e:
-        logger.warning(f"⚠ Could not preload model: {e}")
-        logger.warning("Model will be loaded on first verification request")
+    if settings.WRITE_BEHIND:
+        await verification_writer.start()
+        logger.info("✓ Write-behind history persistence enabled")
+    
+    logger.info(f"✓ App imports took {readiness['import_ms']:.0f}ms, warming up models...")
+    warm_up_task = asyncio.create_task(warm_up_models())
+    
+    await verification_jobs.start()
+    logger.info(f"✓ Verification job workers: {verification_jobs.workers}")
     
     # Log configuration
-    logger.info(f"✓ DeepFace model: {settings.DEEPFACE_MODEL}")
-    logger.info(f"✓ Verification threshold: {settings.VERIFICATION_THRESHOLD}")
+    logger.info(f"✓ Embedding backend: {settings.EMBEDDING_BACKEND}")
+    logger.info(f"✓ Verification threshold: {verification_threshold()}")
     logger.info(f"✓ Environment: {'Production' if os.getenv('SPACE_ID') else 'Development'}")
     
     logger.info("✓ Application startup complete")
@@ -49,6 +123,13 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down application...")
+    warm_up_task.cancel()
+    await verification_jobs.stop()
+    await verification_writer.stop()
+    await encoding_batcher.stop()
+    await age_batcher.stop()
+    inference_executor.shutdown()
+    password_hash_pool.shutdown(wait=False)
     await close_mongo_connection()
     logger.info("✓ Application shutdown complete")
 
@@ -61,6 +142,17 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Oversized bodies are refused before multipart parsing spools them
+app.add_middleware(
+    RequestSizeLimit,
+    max_size=settings.MAX_REQUEST_SIZE,
+    overrides={
+        "/verify/batch": settings.MAX_BATCH_REQUEST_SIZE,
+        "/gallery/enroll": settings.MAX_BATCH_REQUEST_SIZE,
+        "/verify/frames": settings.MULTIFRAME_MAX_REQUEST_SIZE,
+    },
+)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -76,9 +168,49 @@ app.add_middleware(
     max_age=3600,
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so path parameters don't explode cardinality
+    route = request.scope.get("route")
+    REQUEST_DURATION.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code
+    )
+    return response
+
+@registry.collector
+def collect_runtime_gauges():
+    """Queue depths and cache counters from the components' own stats"""
+    inference = inference_executor.stats()
+    cache = embedding_cache.stats()
+    users = user_cache.stats()
+    return [
+        ("app_ready", "gauge", "1 once the models are loaded and warmed up", int(readiness["ready"])),
+        ("inference_active_jobs", "gauge", "Jobs running in the inference workers", inference["active"]),
+        ("inference_queued_jobs", "gauge", "Jobs waiting for an inference worker", inference["queued"]),
+        ("inference_rejected_total", "counter", "Jobs rejected because the inference queue was full", inference["rejected"]),
+        ("inference_timed_out_total", "counter", "Inference jobs that exceeded the timeout", inference["timed_out"]),
+        ("admission_active", "gauge", "Admitted verifications holding an inference slot", admission.stats()["active"]),
+        ("admission_waiting", "gauge", "Requests queued by admission control", admission.stats()["waiting"]),
+        ("encode_pending_faces", "gauge", "Faces waiting for the next encoding batch", encoding_batcher.stats()["pending"]),
+        ("embedding_cache_hits_total", "counter", "Embedding cache memory and disk hits", cache["hits"] + cache["disk_hits"] + cache["coalesced"]),
+        ("embedding_cache_misses_total", "counter", "Embedding cache misses", cache["misses"]),
+        ("embedding_cache_evictions_total", "counter", "Embedding cache entries evicted to stay within EMBEDDING_CACHE_SIZE", cache["evictions"]),
+        ("embedding_cache_expirations_total", "counter", "Embedding cache entries dropped after EMBEDDING_CACHE_TTL", cache["expirations"]),
+        ("user_cache_hits_total", "counter", "Authenticated user cache hits", users["hits"]),
+        ("user_cache_misses_total", "counter", "Authenticated user cache misses", users["misses"]),
+        ("verification_jobs_queued", "gauge", "Asynchronous verification jobs waiting for a job worker", verification_jobs.stats()["queued"]),
+        ("write_behind_queued_records", "gauge", "Verification records waiting to be flushed", verification_writer.stats()["queued"]),
+    ]
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(verify_router)
+app.include_router(gallery_router)
 
 @app.get("/")
 async def root():
@@ -86,14 +218,30 @@ async def root():
         "message": "Cross-Age Face Verification API",
         "version": "2.0.0",
         "status": "running",
-        "model": settings.DEEPFACE_MODEL,
-        "threshold": settings.VERIFICATION_THRESHOLD,
+        "model": settings.EMBEDDING_BACKEND,
+        "threshold": verification_threshold(),
         "docs": "/docs"
     }
 
 @app.get("/health")
 async def health_check():
+    """Liveness and readiness only; pipeline figures are on /metrics"""
     return {
-        "status": "healthy",
-        "model": settings.DEEPFACE_MODEL
-    }
\ No newline at end of file
+        "status": "healthy" if readiness["ready"] else "starting",
+        "readiness": readiness
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """200 once the models are warm, 503 while warming up or if warm-up failed"""
+    if not readiness["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed" if readiness["error"] else "starting", **readiness}
+        )
+    return {"status": "ready", **readiness, "embedding_backend": embedding_backend}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of latency histograms and counters"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,166 @@
+"""
+Minimal in-process metrics with Prometheus text exposition
+Counters and histograms are plain dicts updated from the event loop;
+gauges for queues and caches are collected from their stats() on scrape,
+so nothing is computed on the request path beyond a dict update.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# Seconds; covers sub-millisecond cache hits up to multi-second inference
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: dict) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally labelled"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally labelled"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # One count per bucket plus +Inf, then the sum
+            state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, float]]]] = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Callable[[], List[Tuple[str, str, str, float]]]):
+        """Register fn() -> [(name, type, help, value)], called on every scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            for name, metric_type, documentation, value in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route and status"
+)
+STAGE_DURATION = registry.histogram(
+    "stage_duration_seconds", "Latency of individual pipeline stages"
+)
+FACES_DETECTED = registry.histogram(
+    "faces_detected", "Faces found per processed image", buckets=(0, 1, 2, 3, 5, 10)
+)
+BATCH_SIZES = registry.histogram(
+    "inference_batch_size", "Faces per batched worker job", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BATCH_WAIT = registry.histogram(
+    "encode_batch_wait_seconds", "Time a face waited in the micro-batcher before its batch was dispatched",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+FRAMES_DECODED = registry.histogram(
+    "multiframe_frames_decoded", "Frames decoded per multi-frame verification", buckets=(1, 2, 3, 4, 6, 8, 16, 32, 64)
+)
+LOGIN_DURATION = registry.histogram(
+    "login_duration_seconds", "POST /auth/login latency including bcrypt"
+)
+PASSWORD_HASH_REJECTED = registry.counter(
+    "password_hash_rejected_total", "Logins and signups turned away because the bcrypt queue was full"
+)
+NO_FACE_RESULTS = registry.counter(
+    "no_face_results_total", "Verifications that returned no_match because an image had no face"
+)
+UPLOADS_REJECTED = registry.counter(
+    "uploads_rejected_total", "Uploads refused before decoding, by reason"
+)
+ADMISSIONS = registry.counter(
+    "admission_decisions_total", "Admission control outcomes: admitted, queued, rejected, rate_limited"
+)
+VERIFICATIONS = registry.counter(
+    "verifications_total", "Completed verifications by result"
+)
+
+
+def stage(name: str):
+    """Context manager timing one stage into stage_duration_seconds"""
+    return STAGE_DURATION.time(stage=name)
@@ -0,0 +1,77 @@
+"""
+Age estimation with the exported ResNet50 regressor
+The Keras model from training_notebook.ipynb is exported to ONNX (see
+age_export.py) and served with ONNX Runtime on CPU. Batches of face crops
+run in the inference workers, one session per worker process.
+"""
+import logging
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+from ..config import settings
+from .onnx_session import ModelUnavailable, create_session
+
+logger = logging.getLogger(__name__)
+
+INPUT_SIZE = (224, 224)
+# keras.applications.resnet50.preprocess_input ("caffe" mode): BGR, mean-centred
+IMAGENET_BGR_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+_session = None
+
+
+class AgeModelUnavailable(ModelUnavailable):
+    """Raised when age estimation is not configured or cannot be loaded"""
+
+
+def age_enabled() -> bool:
+    return bool(settings.AGE_MODEL_PATH)
+
+
+def preprocess_crops(crops: List[np.ndarray]) -> np.ndarray:
+    """
+    Face crops -> (N, 224, 224, 3) float32 in ResNet50 input space
+
+    Nearest-neighbour resizing matches the Keras ImageDataGenerator the
+    model was trained with.
+    """
+    batch = np.empty((len(crops), *INPUT_SIZE, 3), dtype=np.float32)
+    for i, crop in enumerate(crops):
+        batch[i] = np.asarray(Image.fromarray(crop).resize(INPUT_SIZE, Image.NEAREST), dtype=np.float32)
+    return batch[..., ::-1] - IMAGENET_BGR_MEAN
+
+
+def load_age_model():
+    """Load and warm up this process's age session (no-op once loaded)"""
+    global _session
+    if _session is None:
+        if not age_enabled():
+            raise AgeModelUnavailable("Age estimation is not enabled")
+        try:
+            session = create_session(settings.AGE_MODEL_PATH, settings.AGE_THREADS)
+        except ModelUnavailable as e:
+            raise AgeModelUnavailable(str(e))
+        input_name = session.get_inputs()[0].name
+        session.run(None, {input_name: np.zeros((1, *INPUT_SIZE, 3), dtype=np.float32)})
+        _session = session
+        logger.info(f"Age model loaded from {settings.AGE_MODEL_PATH}")
+    return _session
+
+
+def run_age_model(session, batch: np.ndarray) -> np.ndarray:
+    """Predicted ages for a preprocessed batch"""
+    input_name = session.get_inputs()[0].name
+    return session.run(None, {input_name: batch})[0].reshape(-1)
+
+
+def estimate_age_batch(crops: List[np.ndarray], locations: Optional[list] = None) -> List[float]:
+    """
+    Ages for a batch of face crops, rounded to one decimal like predict_age
+
+    Runs in an inference worker; locations are accepted so this can share
+    the batcher interface with encode_face_batch.
+    """
+    ages = run_age_model(load_age_model(), preprocess_crops(crops))
+    return [round(float(age), 1) for age in np.clip(ages, 0, None)]
@@ -0,0 +1,199 @@
+"""
+Export, quantize and benchmark the age model
+
+    # Keras -> ONNX (float32), then int8 (static, calibrated) and float16
+    python -m app.ml.age_export export age_model.keras --output models/age.onnx \\
+        --quantize int8 float16 --calibration-dir FGNET/images
+
+    # Latency and MAE of the Keras model against the exported variants
+    python -m app.ml.age_export benchmark FGNET/images --keras age_model.keras \\
+        --onnx models/age.onnx models/age.int8.onnx models/age.fp16.onnx
+
+Exporting needs tensorflow and tf2onnx, quantizing needs onnx,
+onnxruntime and (for float16) onnxconverter-common; none of these are
+needed to serve an exported model. Both commands feed the models face
+crops prepared exactly as the API does, so the MAE reflects serving.
+"""
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .age import INPUT_SIZE, preprocess_crops, run_age_model
+from .onnx_session import create_session
+from .evaluation import list_dataset
+
+logger = logging.getLogger(__name__)
+
+
+def load_face_crops(images_dir: str, limit: int = 0) -> tuple:
+    """(crops, ages) for dataset images that have a face and an age in their name"""
+    from .model_loader import detect_face
+
+    crops, ages = [], []
+    for item in list_dataset(images_dir):
+        if item["age"] is None:
+            continue
+        face = detect_face(item["path"])
+        if face["crop"] is None:
+            continue
+        crops.append(face["crop"])
+        ages.append(item["age"])
+        if limit and len(crops) >= limit:
+            break
+    if not crops:
+        raise SystemExit(f"No usable face images in {images_dir}")
+    return crops, np.asarray(ages, dtype=np.float32)
+
+
+def export_onnx(keras_path: str, output: str, opset: int = 13):
+    """Convert the trained Keras model to a float32 ONNX graph"""
+    import tensorflow as tf
+    import tf2onnx
+
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    signature = [tf.TensorSpec((None, *INPUT_SIZE, 3), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=output)
+    logger.info(f"Exported {keras_path} to {output}")
+
+
+class CropCalibrationReader:
+    """Feeds preprocessed face crops to onnxruntime's static quantizer"""
+
+    def __init__(self, input_name: str, crops: List[np.ndarray], batch_size: int = 8):
+        self._batches = iter(
+            {input_name: preprocess_crops(crops[i:i + batch_size])}
+            for i in range(0, len(crops), batch_size)
+        )
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def quantize_int8(model_path: str, output: str, calibration_crops: List[np.ndarray]):
+    """
+    Static int8 quantization (QDQ, per-channel weights)
+
+    Static rather than dynamic: ResNet50 is almost all convolutions, which
+    dynamic quantization leaves as slow ConvInteger ops on most CPUs.
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    # Fold constants and infer shapes first so more ops get quantized
+    prepared = str(Path(output).with_suffix(".prep.onnx"))
+    quant_pre_process(model_path, prepared, skip_symbolic_shape=True)
+
+    input_name = create_session(prepared).get_inputs()[0].name
+    quantize_static(
+        prepared,
+        output,
+        CropCalibrationReader(input_name, calibration_crops),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    Path(prepared).unlink()
+    logger.info(f"Wrote int8 model to {output}")
+
+
+def quantize_float16(model_path: str, output: str):
+    """float16 weights and activations, float32 inputs and outputs"""
+    import onnx
+    from onnxconverter_common import float16
+
+    model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+    onnx.save(model, output)
+    logger.info(f"Wrote float16 model to {output}")
+
+
+def measure(predict: Callable[[np.ndarray], np.ndarray], crops: List[np.ndarray], ages: np.ndarray, batch_sizes=(1, 16)) -> dict:
+    """MAE over all crops and per-image latency at each batch size"""
+    predictions = np.concatenate([
+        predict(preprocess_crops(crops[i:i + 16])) for i in range(0, len(crops), 16)
+    ])
+    result = {"images": len(crops), "mae": round(float(np.abs(predictions - ages).mean()), 3), "latency": {}}
+
+    for batch_size in batch_sizes:
+        batch = preprocess_crops((crops * batch_size)[:batch_size])
+        predict(batch)
+        timings = []
+        for _ in range(max(3, 64 // batch_size)):
+            started = time.perf_counter()
+            predict(batch)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings = np.asarray(timings)
+        result["latency"][f"batch_{batch_size}"] = {
+            "p50_ms": round(float(np.percentile(timings, 50)), 3),
+            "per_image_ms": round(float(np.percentile(timings, 50)) / batch_size, 3),
+        }
+    return result
+
+
+def benchmark(images_dir: str, keras_path: str, onnx_paths: List[str], limit: int, threads: int) -> Dict[str, dict]:
+    crops, ages = load_face_crops(images_dir, limit)
+    results = {}
+
+    if keras_path:
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(keras_path, compile=False)
+        results["keras"] = measure(lambda batch: model.predict(batch, verbose=0).reshape(-1), crops, ages)
+
+    for path in onnx_paths:
+        session = create_session(path, threads)
+        results[Path(path).name] = measure(lambda batch: run_age_model(session, batch), crops, ages)
+
+    for name, result in results.items():
+        latency = ", ".join(f"{k} {v['per_image_ms']:.2f} ms/img" for k, v in result["latency"].items())
+        print(f"{name:24s} MAE {result['mae']:6.2f}  {latency}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and benchmark the age model")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="convert the Keras model to ONNX and quantize it")
+    export.add_argument("keras_model")
+    export.add_argument("--output", default="models/age.onnx")
+    export.add_argument("--quantize", nargs="*", choices=("int8", "float16"), default=["int8"])
+    export.add_argument("--calibration-dir", help="face images for int8 calibration")
+    export.add_argument("--calibration-images", type=int, default=200)
+
+    bench = commands.add_parser("benchmark", help="compare latency and MAE of Keras and ONNX models")
+    bench.add_argument("images_dir", help="FG-NET style images with the age in the file name")
+    bench.add_argument("--keras", help="float Keras model to compare against")
+    bench.add_argument("--onnx", nargs="*", default=[], help="exported ONNX models")
+    bench.add_argument("--limit", type=int, default=0, help="use at most this many images")
+    bench.add_argument("--threads", type=int, default=1, help="ONNX Runtime intra-op threads")
+    bench.add_argument("--output", help="write the results as JSON")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "export":
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        export_onnx(args.keras_model, str(output))
+        if "int8" in args.quantize:
+            if not args.calibration_dir:
+                raise SystemExit("int8 quantization needs --calibration-dir")
+            crops, _ = load_face_crops(args.calibration_dir, args.calibration_images)
+            quantize_int8(str(output), str(output.with_suffix(".int8.onnx")), crops)
+        if "float16" in args.quantize:
+            quantize_float16(str(output), str(output.with_suffix(".fp16.onnx")))
+    else:
+        results = benchmark(args.images_dir, args.keras, args.onnx, args.limit, args.threads)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
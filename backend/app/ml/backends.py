@@ -0,0 +1,180 @@
+"""
+Registry of face embedding backends
+EMBEDDING_BACKEND picks the model that turns detected face crops into
+vectors; detection is the same HOG pipeline for all of them. Backends load
+their model on first use, and warm_up() encodes a real face crop and records
+the per-image encode cost so deployments can weigh throughput against
+accuracy. dlib is imported lazily: only the inference workers need it.
+"""
+import logging
+import time
+from typing import Dict, List, Optional, Type
+
+import numpy as np
+from PIL import Image
+
+from ..config import settings
+from .onnx_session import create_session
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend:
+    """
+    Base class: encode(crops, locations) -> one vector per crop
+
+    Class attributes describe how distances between this backend's vectors
+    are interpreted: `threshold` is the default verification distance,
+    `gallery_threshold` the default for L2-normalized gallery search and
+    `max_distance` the distance that maps to zero confidence.
+    """
+
+    name = ""
+    dimension = 0
+    threshold = 0.0
+    gallery_threshold = 0.0
+    max_distance = 1.2
+
+    def __init__(self):
+        self._loaded = False
+        self.load_ms: Optional[float] = None
+        self.cost: Dict[str, float] = {}
+
+    def load(self):
+        """Load the model once per process"""
+        if self._loaded:
+            return
+        started = time.perf_counter()
+        self._load()
+        self.load_ms = (time.perf_counter() - started) * 1000
+        self._loaded = True
+        logger.info(f"Embedding backend {self.name} loaded in {self.load_ms:.0f}ms")
+
+    def _load(self):
+        pass
+
+    def encode(self, crops: List[np.ndarray], locations: List[tuple]) -> List[np.ndarray]:
+        self.load()
+        return self._encode(crops, locations)
+
+    def _encode(self, crops: List[np.ndarray], locations: List[tuple]) -> List[np.ndarray]:
+        raise NotImplementedError
+
+    def warm_up(self, crop: np.ndarray, location: tuple, batch_size: int = 8) -> Dict[str, float]:
+        """Encode a face crop and record per-image cost for batch sizes 1 and batch_size"""
+        self.load()
+        # The first call pays for lazy initialisation inside the runtime
+        self._encode([crop], [location])
+        for size in (1, batch_size):
+            started = time.perf_counter()
+            self._encode([crop] * size, [location] * size)
+            self.cost[f"encode_ms_per_image_batch_{size}"] = (time.perf_counter() - started) * 1000 / size
+        return self.cost
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "dimension": self.dimension,
+            "threshold": settings.VERIFICATION_THRESHOLD or self.threshold,
+            "loaded": self._loaded,
+            "load_ms": self.load_ms,
+            **self.cost,
+        }
+
+
+class DlibBackend(EmbeddingBackend):
+    """dlib's ResNet (face_recognition), 128-d, landmarks from the 5-point model"""
+
+    name = "dlib"
+    dimension = 128
+    threshold = 0.6
+    gallery_threshold = 0.45
+    max_distance = 1.2
+
+    def _load(self):
+        # Importing face_recognition.api loads the detector, landmark and ResNet weights
+        import face_recognition.api  # noqa: F401
+
+    def _encode(self, crops, locations):
+        import dlib
+        from face_recognition.api import _raw_face_landmarks, face_encoder
+
+        batch_faces = []
+        for crop, location in zip(crops, locations):
+            faces = dlib.full_object_detections()
+            faces.extend(_raw_face_landmarks(crop, [location], model="small"))
+            batch_faces.append(faces)
+
+        descriptors = face_encoder.compute_face_descriptor(crops, batch_faces)
+        return [np.array(faces[0]) for faces in descriptors]
+
+
+class FaceNet512Backend(EmbeddingBackend):
+    """
+    FaceNet-512 exported to ONNX (the model DeepFace calls Facenet512)
+
+    Faces are cut to their detection box, padded to a square, resized to
+    160x160 and scaled to [0, 1]; outputs are L2-normalized, so distances
+    are DeepFace's euclidean_l2 and its 1.04 threshold applies.
+    """
+
+    name = "facenet512"
+    dimension = 512
+    threshold = 1.04
+    gallery_threshold = 1.04
+    max_distance = 2.0
+    input_size = 160
+
+    def _load(self):
+        self._session = create_session(settings.FACENET_MODEL_PATH, settings.FACENET_THREADS)
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self._channels_first = model_input.shape[1] == 3
+
+    def _preprocess(self, crop: np.ndarray, location: tuple) -> np.ndarray:
+        top, right, bottom, left = location
+        face = Image.fromarray(crop[max(0, top):bottom, max(0, left):right])
+        scale = self.input_size / max(face.size)
+        face = face.resize((max(1, round(face.width * scale)), max(1, round(face.height * scale))), Image.BILINEAR)
+
+        square = Image.new("RGB", (self.input_size, self.input_size))
+        square.paste(face, ((self.input_size - face.width) // 2, (self.input_size - face.height) // 2))
+        return np.asarray(square, dtype=np.float32) / 255
+
+    def _encode(self, crops, locations):
+        batch = np.stack([self._preprocess(crop, location) for crop, location in zip(crops, locations)])
+        if self._channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        vectors = self._session.run(None, {self._input_name: batch})[0].astype(np.float64)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return list(vectors)
+
+
+BACKENDS: Dict[str, Type[EmbeddingBackend]] = {
+    DlibBackend.name: DlibBackend,
+    FaceNet512Backend.name: FaceNet512Backend,
+}
+
+_backend: Optional[EmbeddingBackend] = None
+
+
+def get_backend() -> EmbeddingBackend:
+    """The configured backend for this process (its model loads on first use)"""
+    global _backend
+    if _backend is None:
+        if settings.EMBEDDING_BACKEND not in BACKENDS:
+            raise ValueError(
+                f"Unknown embedding backend {settings.EMBEDDING_BACKEND!r}, choose from {', '.join(BACKENDS)}"
+            )
+        _backend = BACKENDS[settings.EMBEDDING_BACKEND]()
+    return _backend
+
+
+def verification_threshold() -> float:
+    """VERIFICATION_THRESHOLD, or the backend's default when it is 0"""
+    return settings.VERIFICATION_THRESHOLD or get_backend().threshold
+
+
+def gallery_threshold() -> float:
+    """GALLERY_MATCH_THRESHOLD, or the backend's default when it is 0"""
+    return settings.GALLERY_MATCH_THRESHOLD or get_backend().gallery_threshold
@@ -0,0 +1,136 @@
+"""
+Dynamic micro-batching of face encodings
+Face crops from concurrent requests are collected for a short window and
+encoded together in a single worker job. The same batcher drives age
+estimation when an age model is configured.
+"""
+import asyncio
+import logging
+from typing import Callable, List, Optional, Set
+
+import numpy as np
+
+from ..config import settings
+from ..metrics import BATCH_SIZES, BATCH_WAIT, stage
+from .executor import InferenceExecutor, inference_executor
+from .age import estimate_age_batch
+from .model_loader import encode_face_batch
+
+logger = logging.getLogger(__name__)
+
+
+class EncodingBatcher:
+    """
+    Collects (crop, location) pairs and encodes them in batches
+
+    A batch is dispatched when it reaches `max_batch_size` or when the
+    oldest item has waited `window_ms`, whichever comes first. `batch_fn`
+    is the worker function called with (crops, locations); it must return
+    one result per crop.
+    """
+
+    def __init__(
+        self,
+        executor: InferenceExecutor,
+        max_batch_size: int = 16,
+        window_ms: float = 5.0,
+        batch_fn: Callable = encode_face_batch,
+        name: str = "encode",
+    ):
+        self.executor = executor
+        self.batch_fn = batch_fn
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only holds tasks weakly; kept here until each batch is done
+        self._tasks: Set[asyncio.Task] = set()
+        self._batches = 0
+        self._items = 0
+        self._max_seen = 0
+
+    async def encode(self, crop: np.ndarray, location: tuple) -> np.ndarray:
+        """Queue one face and wait for its result (the 128-d vector by default)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((crop, location, future, loop.time()))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Dispatch whatever is pending and wait for every batch in flight"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, batch: List[tuple]):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._batches += 1
+        self._items += len(batch)
+        self._max_seen = max(self._max_seen, len(batch))
+        BATCH_SIZES.observe(len(batch), job=self.name)
+        for _, _, _, queued_at in batch:
+            BATCH_WAIT.observe(now - queued_at, job=self.name)
+
+        crops = [crop for crop, _, _, _ in batch]
+        locations = [location for _, location, _, _ in batch]
+        try:
+            with stage(f"{self.name}_batch"):
+                encodings = await self.executor.run(self.batch_fn, crops, locations)
+        except Exception as e:
+            logger.error(f"Batch {self.name} failed ({len(batch)} faces): {e}")
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future, _), encoding in zip(batch, encodings):
+            if not future.done():
+                future.set_result(encoding)
+
+    def stats(self) -> dict:
+        """Batch-size counters; queue-wait percentiles are on /metrics"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "pending": len(self._pending),
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+            "largest_batch": self._max_seen,
+            "in_flight": len(self._tasks),
+        }
+
+
+encoding_batcher = EncodingBatcher(
+    inference_executor,
+    max_batch_size=settings.ENCODE_BATCH_SIZE,
+    window_ms=settings.ENCODE_BATCH_WINDOW_MS,
+)
+
+age_batcher = EncodingBatcher(
+    inference_executor,
+    max_batch_size=settings.ENCODE_BATCH_SIZE,
+    window_ms=settings.ENCODE_BATCH_WINDOW_MS,
+    batch_fn=estimate_age_batch,
+    name="age",
+)
@@ -0,0 +1,188 @@
+"""
+Content-addressed cache of face detections and encodings
+Keyed by the SHA-256 of the uploaded bytes, so a re-submitted photo
+costs a dictionary lookup instead of a decode, detection and encoding.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def image_digest(data: bytes) -> str:
+    """SHA-256 hex digest used as the cache key"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache mapping image digest -> detected face
+
+    Values are dicts with the primary face's location and encoding (both
+    None when the image has no face), the number of faces found and the
+    estimated age (None unless age estimation is enabled).
+    The memory tier is an LRU bounded by `max_entries` with a per-entry TTL.
+    The optional disk tier stores one .npz per digest under
+    `disk_dir/namespace` and survives restarts; the namespace identifies the
+    backend and detection settings the entries were computed with. Concurrent lookups of the same digest share a single
+    computation.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, disk_dir: Optional[str] = None, namespace: str = "default"):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.namespace = namespace
+        self.disk_dir = Path(disk_dir) / namespace if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    async def get_or_compute(self, digest: str, compute: Callable[[], Awaitable]):
+        """Return the cached value for digest, computing it at most once"""
+        value = self._get_memory(digest)
+        if value is not _MISSING:
+            self._hits += 1
+            return value
+
+        task = self._inflight.get(digest)
+        if task is not None:
+            self._coalesced += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._load(digest, compute))
+        self._inflight[digest] = task
+        task.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, digest: str, compute: Callable[[], Awaitable]):
+        if self.disk_dir:
+            loop = asyncio.get_running_loop()
+            value = await loop.run_in_executor(None, self._read_disk, digest)
+            if value is not _MISSING:
+                self._disk_hits += 1
+                self._put_memory(digest, value)
+                return value
+
+        self._misses += 1
+        value = await compute()
+        self._put_memory(digest, value)
+
+        if self.disk_dir:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, self._write_disk, digest, value)
+
+        return value
+
+    def _get_memory(self, digest: str):
+        entry = self._entries.get(digest)
+        if entry is None:
+            return _MISSING
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[digest]
+            self._expirations += 1
+            return _MISSING
+
+        self._entries.move_to_end(digest)
+        return value
+
+    def _put_memory(self, digest: str, value):
+        self._entries[digest] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def _disk_path(self, digest: str) -> Path:
+        return self.disk_dir / digest[:2] / f"{digest}.npz"
+
+    def _read_disk(self, digest: str):
+        path = self._disk_path(digest)
+        if not path.exists():
+            return _MISSING
+        try:
+            with np.load(path) as data:
+                face = {"location": None, "encoding": None, "faces_found": int(data["faces_found"]), "age": None}
+                if face["faces_found"]:
+                    face["location"] = tuple(int(v) for v in data["location"])
+                    face["encoding"] = data["encoding"]
+                if "age" in data:
+                    face["age"] = float(data["age"])
+                return face
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            return _MISSING
+
+    def _write_disk(self, digest: str, value):
+        path = self._disk_path(digest)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                if value["encoding"] is None:
+                    np.savez(f, faces_found=value["faces_found"])
+                else:
+                    arrays = {
+                        "faces_found": value["faces_found"],
+                        "location": np.asarray(value["location"]),
+                        "encoding": value["encoding"],
+                    }
+                    if value.get("age") is not None:
+                        arrays["age"] = value["age"]
+                    np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+
+    def clear(self):
+        """Drop the memory tier (the disk tier is left untouched)"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters"""
+        lookups = self._hits + self._disk_hits + self._misses + self._coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk_tier": str(self.disk_dir) if self.disk_dir else None,
+            "hits": self._hits,
+            "disk_hits": self._disk_hits,
+            "coalesced": self._coalesced,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "hit_rate": (lookups - self._misses) / lookups if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_SIZE,
+    ttl_seconds=settings.EMBEDDING_CACHE_TTL,
+    disk_dir=settings.EMBEDDING_CACHE_DIR or None,
+    namespace=f"{settings.EMBEDDING_BACKEND}-{settings.FACE_SELECTION}-{settings.DECODE_MAX_SIDE}-{settings.DETECT_MAX_SIDE}",
+)
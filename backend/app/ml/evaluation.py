@@ -0,0 +1,295 @@
+"""
+Offline evaluation of face verification on FG-NET
+
+Every image is embedded exactly once (in a process pool, reusing earlier
+runs through an on-disk store keyed by content digest), then all pairs are
+scored at once from a NumPy distance matrix: ROC-AUC, EER, accuracy at the
+serving threshold, a threshold sweep and true-accept rates by age gap.
+
+Usage (from backend/):
+    python -m app.ml.evaluation /path/to/FGNET/images --output evaluation.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .backends import get_backend, verification_threshold
+from .embedding_cache import embedding_cache, image_digest
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+AGE_GAP_BINS = (0, 5, 10, 20, 30, 100)
+
+
+def parse_fgnet_filename(name: str) -> Tuple[Optional[str], Optional[int]]:
+    """(person_id, age) from an FG-NET name such as 001A02.JPG"""
+    person = re.match(r"(\d{3})", name)
+    age = re.search(r"A(\d+)", name, re.IGNORECASE)
+    return (person.group(1) if person else None, int(age.group(1)) if age else None)
+
+
+def list_dataset(images_dir: str) -> List[dict]:
+    """Images with a parseable person id, sorted by name"""
+    dataset = []
+    for path in sorted(Path(images_dir).iterdir()):
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        person, age = parse_fgnet_filename(path.name)
+        if person is None:
+            logger.warning(f"Skipping {path.name}: no person id in the file name")
+            continue
+        dataset.append({"path": str(path), "person": person, "age": age})
+    return dataset
+
+
+class EmbeddingStore:
+    """
+    Encodings keyed by image digest, persisted as a single .npz
+
+    The file name carries the embedding cache namespace, so changing the
+    detection settings starts a fresh store instead of mixing results.
+    Images without a face are stored with a NaN encoding.
+    """
+
+    def __init__(self, directory: str, namespace: str = embedding_cache.namespace):
+        self.path = Path(directory) / f"embeddings-{namespace}.npz"
+        self._encodings: Dict[str, np.ndarray] = {}
+        if self.path.exists():
+            with np.load(self.path) as data:
+                self._encodings = dict(zip(data["digests"].tolist(), data["encodings"]))
+            logger.info(f"Loaded {len(self._encodings)} stored embeddings from {self.path}")
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._encodings
+
+    def __len__(self) -> int:
+        return len(self._encodings)
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        encoding = self._encodings.get(digest)
+        if encoding is None or np.isnan(encoding).any():
+            return None
+        return encoding
+
+    def put(self, digest: str, encoding: Optional[np.ndarray]):
+        self._encodings[digest] = np.full(get_backend().dimension, np.nan) if encoding is None else np.asarray(encoding, dtype=np.float64)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                digests=np.array(list(self._encodings), dtype="U64"),
+                encodings=np.stack(list(self._encodings.values())) if self._encodings else np.empty((0, get_backend().dimension)),
+            )
+        os.replace(tmp_path, self.path)
+
+
+def _embed_chunk(paths: List[str]) -> List[Optional[np.ndarray]]:
+    """Detect in each image, then encode all found faces in one batch (runs in a worker)"""
+    from .model_loader import detect_face, encode_face_batch
+
+    faces = [detect_face(path) for path in paths]
+    found = [face for face in faces if face["crop"] is not None]
+    encodings = iter(encode_face_batch([f["crop"] for f in found], [f["crop_location"] for f in found]) if found else [])
+    return [next(encodings) if face["crop"] is not None else None for face in faces]
+
+
+def embed_dataset(dataset: List[dict], store: EmbeddingStore, workers: int = 0, chunk_size: int = 16) -> np.ndarray:
+    """
+    (N, dimension) encodings for the dataset, NaN rows where no face was found
+
+    Only images missing from the store are embedded; the store is saved
+    afterwards so the next run embeds nothing.
+    """
+    digests = []
+    for item in dataset:
+        with open(item["path"], "rb") as f:
+            digests.append(image_digest(f.read()))
+
+    missing = [(item["path"], digest) for item, digest in zip(dataset, digests) if digest not in store]
+    if missing:
+        workers = workers or os.cpu_count() or 1
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        started = time.perf_counter()
+        logger.info(f"Embedding {len(missing)} images with {workers} workers")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for chunk, encodings in zip(chunks, pool.map(_embed_chunk, [[path for path, _ in c] for c in chunks])):
+                for (_, digest), encoding in zip(chunk, encodings):
+                    store.put(digest, encoding)
+        store.save()
+        logger.info(f"Embedded {len(missing)} images in {time.perf_counter() - started:.1f}s")
+
+    missing_face = np.full(get_backend().dimension, np.nan)
+    return np.stack([
+        encoding if (encoding := store.get(digest)) is not None else missing_face
+        for digest in digests
+    ])
+
+
+def distance_matrix(encodings: np.ndarray) -> np.ndarray:
+    """Euclidean distances between all rows, as compare_encodings computes them"""
+    squared = np.einsum("ij,ij->i", encodings, encodings)
+    gram = encodings @ encodings.T
+    return np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * gram, 0))
+
+
+def roc_auc(distances: np.ndarray, labels: np.ndarray) -> float:
+    """Probability that a random positive pair is closer than a random negative one (ties count half)"""
+    order = np.argsort(distances, kind="mergesort")
+    sorted_distances = distances[order]
+    # Average ranks over tied distances
+    _, first, counts = np.unique(sorted_distances, return_index=True, return_counts=True)
+    ranks = np.empty(len(distances))
+    ranks[order] = np.repeat(first + (counts + 1) / 2, counts)
+
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    rank_sum = ranks[labels].sum()
+    # Low distance means "same person", so a positive should rank low
+    return float(1 - (rank_sum - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def roc_curve(distances: np.ndarray, labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(thresholds, tpr, fpr) with a match meaning distance <= threshold"""
+    order = np.argsort(distances, kind="mergesort")
+    sorted_distances = distances[order]
+    sorted_labels = labels[order]
+    true_positives = np.cumsum(sorted_labels)
+    false_positives = np.cumsum(~sorted_labels)
+    # Keep the last index of every run of equal distances
+    last = np.r_[np.nonzero(np.diff(sorted_distances))[0], len(sorted_distances) - 1]
+    return (
+        sorted_distances[last],
+        true_positives[last] / max(1, labels.sum()),
+        false_positives[last] / max(1, (~labels).sum()),
+    )
+
+
+def equal_error_rate(thresholds: np.ndarray, tpr: np.ndarray, fpr: np.ndarray) -> Tuple[float, float]:
+    """(EER, threshold) where the false accept and false reject rates cross"""
+    fnr = 1 - tpr
+    i = int(np.argmin(np.abs(fpr - fnr)))
+    return float((fpr[i] + fnr[i]) / 2), float(thresholds[i])
+
+
+def confusion_at(distances: np.ndarray, labels: np.ndarray, threshold: float) -> dict:
+    """Accuracy figures for a single threshold"""
+    predicted = distances <= threshold
+    tp = int((predicted & labels).sum())
+    fp = int((predicted & ~labels).sum())
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    tpr = tp / positives if positives else 0.0
+    tnr = (negatives - fp) / negatives if negatives else 0.0
+    return {
+        "threshold": round(float(threshold), 4),
+        "accuracy": (tp + negatives - fp) / len(labels),
+        "balanced_accuracy": (tpr + tnr) / 2,
+        "tpr": tpr,
+        "fpr": fp / negatives if negatives else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+    }
+
+
+def evaluate(encodings: np.ndarray, persons: List[str], ages: List[Optional[int]], threshold: Optional[float] = None, sweep: Optional[np.ndarray] = None) -> dict:
+    """Metrics over every pair of images that have a face"""
+    if threshold is None:
+        threshold = verification_threshold()
+    has_face = ~np.isnan(encodings).any(axis=1)
+    encodings = encodings[has_face]
+    persons = np.asarray(persons)[has_face]
+    ages = np.array([np.nan if age is None else age for age in ages], dtype=float)[has_face]
+
+    rows, cols = np.triu_indices(len(encodings), k=1)
+    distances = distance_matrix(encodings)[rows, cols]
+    labels = persons[rows] == persons[cols]
+
+    thresholds, tpr, fpr = roc_curve(distances, labels)
+    eer, eer_threshold = equal_error_rate(thresholds, tpr, fpr)
+    balanced = (tpr + 1 - fpr) / 2
+    best = int(np.argmax(balanced))
+
+    if sweep is None:
+        # Half to one and a half times the threshold in 5% steps
+        sweep = np.round(threshold * np.arange(0.5, 1.50001, 0.05), 4)
+
+    # Cross-age behaviour: how many genuine pairs are accepted per age gap
+    gaps = np.abs(ages[rows] - ages[cols])[labels]
+    positive_distances = distances[labels]
+    by_age_gap = []
+    for low, high in zip(AGE_GAP_BINS, AGE_GAP_BINS[1:]):
+        in_bin = (gaps >= low) & (gaps < high)
+        if in_bin.any():
+            by_age_gap.append({
+                "age_gap": f"{low}-{high}",
+                "pairs": int(in_bin.sum()),
+                "tpr": float((positive_distances[in_bin] <= threshold).mean()),
+                "mean_distance": float(positive_distances[in_bin].mean()),
+            })
+
+    return {
+        "images": int(len(has_face)),
+        "images_without_face": int((~has_face).sum()),
+        "persons": int(len(np.unique(persons))),
+        "positive_pairs": int(labels.sum()),
+        "negative_pairs": int((~labels).sum()),
+        "roc_auc": roc_auc(distances, labels),
+        "eer": eer,
+        "eer_threshold": eer_threshold,
+        "at_threshold": confusion_at(distances, labels, threshold),
+        "best_balanced_threshold": confusion_at(distances, labels, thresholds[best]),
+        "sweep": [confusion_at(distances, labels, t) for t in sweep],
+        "by_age_gap": by_age_gap,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate face verification on FG-NET")
+    parser.add_argument("images_dir", help="directory of FG-NET images (e.g. FGNET/images)")
+    parser.add_argument("--store", default="evaluation", help="directory for the embedding store")
+    parser.add_argument("--workers", type=int, default=settings.INFERENCE_WORKERS, help="embedding processes (default: all cores)")
+    parser.add_argument("--threshold", type=float, help="distance threshold to report accuracy at (default: the serving threshold)")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    dataset = list_dataset(args.images_dir)
+    if not dataset:
+        raise SystemExit(f"No FG-NET images found in {args.images_dir}")
+
+    encodings = embed_dataset(dataset, EmbeddingStore(args.store), args.workers, settings.ENCODE_BATCH_SIZE)
+
+    started = time.perf_counter()
+    report = evaluate(encodings, [item["person"] for item in dataset], [item["age"] for item in dataset], args.threshold)
+    report["evaluation_seconds"] = round(time.perf_counter() - started, 3)
+
+    at = report["at_threshold"]
+    print(f"Images: {report['images']} ({report['images_without_face']} without a face), persons: {report['persons']}")
+    print(f"Pairs: {report['positive_pairs']} positive, {report['negative_pairs']} negative")
+    print(f"ROC-AUC: {report['roc_auc']:.4f}  EER: {report['eer']:.4f} at {report['eer_threshold']:.4f}")
+    print(f"At {at['threshold']}: accuracy {at['accuracy']:.4f}, balanced {at['balanced_accuracy']:.4f}, TPR {at['tpr']:.4f}, FPR {at['fpr']:.4f}")
+    for row in report["by_age_gap"]:
+        print(f"  age gap {row['age_gap']:>6s}: {row['pairs']:6d} pairs, TPR {row['tpr']:.4f}")
+    print(f"Scored all pairs in {report['evaluation_seconds']}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Process-pool executor for CPU-bound face inference
+dlib detection and encoding hold the GIL for hundreds of milliseconds,
+so they run in worker processes instead of on the event loop.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the submission queue is at capacity"""
+
+
+class InferenceTimeout(Exception):
+    """Raised when a job does not finish within its timeout"""
+
+
+def _init_worker():
+    """Load and warm up the embedding backend, and the age model if configured, once per worker process"""
+    from .model_loader import preload_model
+    try:
+        preload_model()
+    except Exception as e:
+        # Leave the worker alive; the error resurfaces in readiness and on the first encode
+        logger.error(f"Model warm-up failed in worker {os.getpid()}: {e}")
+
+
+def _warm_up():
+    """No-op job used to spawn workers at startup"""
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """
+    Bounded front-end to a ProcessPoolExecutor
+
+    At most `workers` jobs are handed to the pool at a time; up to
+    `queue_size` more may wait for a slot, anything beyond that is rejected
+    with InferenceQueueFull so callers can shed load instead of piling up.
+    """
+
+    def __init__(self, workers: int = 0, queue_size: int = 32, timeout: float = 30.0, start_method: str = "spawn"):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # "fork" lets workers share the models a pre-fork master loaded (see app.serve)
+        self.start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._rejected = 0
+
+    def start(self):
+        """Create the worker pool and start loading models in every worker"""
+        if self._pool is not None:
+            return
+        # Spawn by default: the parent runs Motor's background threads. With
+        # fork the pool must be started before Mongo connects; a fork context
+        # launches every worker on the first submit below.
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+        )
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        for _ in range(self.workers):
+            self._pool.submit(_warm_up)
+        logger.info(f"Inference executor started with {self.workers} worker processes")
+
+    def shutdown(self):
+        """Stop the worker pool, cancelling jobs that have not started"""
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._slots = None
+        logger.info("Inference executor stopped")
+
+    async def run(self, fn: Callable, *args: Any, timeout: Optional[float] = None):
+        """
+        Run fn(*args) in a worker process
+
+        Raises:
+            InferenceQueueFull: if the queue is at capacity
+            InferenceTimeout: if the job (including queue wait) exceeds timeout
+        """
+        if self._pool is None:
+            self.start()
+
+        if self._queued >= self.queue_size and self._slots.locked():
+            self._rejected += 1
+            raise InferenceQueueFull("Inference queue is full")
+
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        self._queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise InferenceTimeout(f"Job waited more than {timeout:.1f}s for a worker")
+        finally:
+            self._queued -= 1
+
+        self._active += 1
+        pool = self._pool
+        try:
+            future = loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # The pool died while idle; nothing was submitted
+            self._release()
+            self._failed += 1
+            self._recover(pool)
+            raise
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the worker is actually free, even if the
+        # caller gives up early - a process job cannot be interrupted
+        future.add_done_callback(self._on_done)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise InferenceTimeout(f"Job did not finish within {timeout:.1f}s")
+        except BrokenProcessPool:
+            self._recover(pool)
+            raise
+
+    def _on_done(self, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            self._failed += 1
+        else:
+            self._completed += 1
+        self._release()
+
+    def _release(self):
+        self._active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def _recover(self, pool: ProcessPoolExecutor):
+        """
+        Replace a broken pool
+
+        Jobs that failed together all land here; only the first replaces
+        the pool they were submitted to, the rest find a new one in place.
+        """
+        if self._pool is not pool:
+            return
+        logger.error("Inference worker died, restarting pool")
+        self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+    def stats(self) -> dict:
+        """Queue depth and worker utilisation snapshot"""
+        return {
+            "workers": self.workers,
+            "start_method": self.start_method,
+            "active": self._active,
+            "queued": self._queued,
+            "queue_size": self.queue_size,
+            "completed": self._completed,
+            "failed": self._failed,
+            "timed_out": self._timed_out,
+            "rejected": self._rejected,
+        }
+
+
+inference_executor = InferenceExecutor(
+    workers=settings.INFERENCE_WORKERS,
+    queue_size=settings.INFERENCE_QUEUE_SIZE,
+    timeout=settings.INFERENCE_TIMEOUT,
+)
@@ -0,0 +1,245 @@
+"""
+Vectorized 1:N face index
+Encodings live in a contiguous, L2-normalized float32 matrix that is
+memory-mapped from disk, so an index opens instantly and its pages are
+shared by every worker process that maps the same files.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 128
+LABEL_DTYPE = "U64"
+
+
+class FaceIndex:
+    """
+    Append-only matrix of face encodings with tombstone deletes
+
+    Files in `directory`:
+        vectors.npy  (capacity, dim) float32, rows L2-normalized
+        labels.npy   (capacity,) person id per row
+        active.npy   (capacity,) bool, False for removed or unused rows
+        meta.json    row count, capacity and a version counter
+
+    Adding writes into the next free row; removing clears `active` flags.
+    Only when capacity runs out are the live rows copied into files twice
+    the size, which also drops tombstoned rows.
+    """
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM, initial_capacity: int = 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._version = -1
+        self._meta_stamp = None
+        self._count = 0
+        self._vectors = None
+        self._labels = None
+        self._active = None
+        self._refresh()
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialise writers across threads and processes"""
+        with self._lock, open(self.directory / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"count": 0, "capacity": 0, "version": 0}
+
+    def _write_meta(self, capacity: int):
+        self._version += 1
+        tmp_path = self._meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"count": self._count, "capacity": capacity, "version": self._version, "dim": self.dim}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _refresh(self):
+        """Re-map the files if another process changed the index"""
+        # meta.json is replaced on every write, so an unchanged inode and
+        # mtime mean an unchanged index and searches skip reading it
+        try:
+            stat = os.stat(self._meta_path)
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp is not None and stamp == self._meta_stamp:
+            return
+        self._meta_stamp = stamp
+
+        meta = self._read_meta()
+        if meta["version"] == self._version:
+            return
+
+        self._count = meta["count"]
+        self._version = meta["version"]
+        if meta["capacity"] == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._labels = np.zeros(0, dtype=LABEL_DTYPE)
+            self._active = np.zeros(0, dtype=bool)
+            return
+
+        if self._vectors is None or len(self._vectors) != meta["capacity"]:
+            self._vectors = np.load(self.directory / "vectors.npy", mmap_mode="r+")
+            self._labels = np.load(self.directory / "labels.npy", mmap_mode="r+")
+            self._active = np.load(self.directory / "active.npy", mmap_mode="r+")
+
+    def _grow(self, needed: int):
+        """Re-allocate with room for `needed` more rows, compacting tombstones"""
+        live = np.flatnonzero(self._active[:self._count])
+        capacity = max(self.initial_capacity, len(self._vectors) * 2)
+        while capacity < len(live) + needed:
+            capacity *= 2
+
+        vectors = np.lib.format.open_memmap(self.directory / "vectors.npy.new", mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        labels = np.lib.format.open_memmap(self.directory / "labels.npy.new", mode="w+", dtype=LABEL_DTYPE, shape=(capacity,))
+        active = np.lib.format.open_memmap(self.directory / "active.npy.new", mode="w+", dtype=bool, shape=(capacity,))
+        vectors[:len(live)] = self._vectors[live]
+        labels[:len(live)] = self._labels[live]
+        active[:len(live)] = True
+        for array in (vectors, labels, active):
+            array.flush()
+
+        for name in ("vectors", "labels", "active"):
+            os.replace(self.directory / f"{name}.npy.new", self.directory / f"{name}.npy")
+
+        self._vectors, self._labels, self._active = vectors, labels, active
+        self._count = len(live)
+        logger.info(f"Face index at {self.directory} resized to {capacity} rows ({len(live)} live)")
+
+    def add(self, label: str, encodings: List[np.ndarray]) -> int:
+        """Append encodings for a person, returns the number of rows added"""
+        if len(encodings) == 0:
+            return 0
+
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+
+        with self._write_lock():
+            if self._count + len(matrix) > len(self._vectors):
+                self._grow(len(matrix))
+
+            start, end = self._count, self._count + len(matrix)
+            self._vectors[start:end] = matrix
+            self._labels[start:end] = label
+            self._active[start:end] = True
+            self._count = end
+            for array in (self._vectors, self._labels, self._active):
+                array.flush()
+            self._write_meta(len(self._vectors))
+
+        return len(matrix)
+
+    def remove(self, label: str) -> int:
+        """Tombstone every row of a person, returns the number of rows removed"""
+        with self._write_lock():
+            rows = np.flatnonzero((self._labels[:self._count] == label) & self._active[:self._count])
+            if len(rows) == 0:
+                return 0
+            self._active[rows] = False
+            self._active.flush()
+            self._write_meta(len(self._vectors))
+
+        return len(rows)
+
+    def search(self, encoding: np.ndarray, top_k: int = 5) -> List[dict]:
+        """
+        Closest identities to a probe encoding
+
+        One matrix-vector product scores every row, argpartition keeps the
+        best candidates and only those are sorted and de-duplicated.
+
+        Returns:
+            list: Up to top_k dicts with label, similarity and distance,
+            best match first, one entry per identity
+        """
+        self._refresh()
+        # Snapshot, a writer thread may swap the arrays while we search
+        vectors, labels, active, count = self._vectors, self._labels, self._active, self._count
+        if count == 0 or top_k <= 0:
+            return []
+
+        probe = np.asarray(encoding, dtype=np.float32)
+        probe = probe / max(float(np.linalg.norm(probe)), 1e-12)
+
+        scores = vectors[:count] @ probe
+        scores[~active[:count]] = -np.inf
+
+        # Over-fetch so several rows of the same person don't crowd out others
+        candidates = min(count, top_k * 8)
+        while True:
+            if candidates < count:
+                rows = np.argpartition(-scores, candidates - 1)[:candidates]
+            else:
+                rows = np.arange(count)
+            rows = rows[np.argsort(-scores[rows])]
+
+            matches, seen = [], set()
+            for row in rows:
+                if scores[row] == -np.inf:
+                    break
+                label = str(labels[row])
+                if label in seen:
+                    continue
+                seen.add(label)
+                similarity = float(scores[row])
+                matches.append({
+                    "label": label,
+                    "similarity": similarity,
+                    "distance": float(np.sqrt(max(0.0, 2 - 2 * similarity))),
+                })
+                if len(matches) == top_k:
+                    return matches
+
+            if candidates >= count:
+                return matches
+            candidates = min(count, candidates * 4)
+
+    def labels(self) -> dict:
+        """Enrolled person ids with their number of encodings"""
+        self._refresh()
+        labels, active, count = self._labels, self._active, self._count
+        live = labels[:count][active[:count]]
+        names, counts = np.unique(live, return_counts=True)
+        return {str(name): int(n) for name, n in zip(names, counts)}
+
+    def __len__(self) -> int:
+        self._refresh()
+        return int(self._active[:self._count].sum())
+
+
+_indexes = {}
+
+
+def get_face_index(directory: str, dim: int = EMBEDDING_DIM) -> FaceIndex:
+    """Process-wide FaceIndex per directory"""
+    index: Optional[FaceIndex] = _indexes.get(directory)
+    if index is None:
+        index = _indexes[directory] = FaceIndex(directory, dim)
+    return index
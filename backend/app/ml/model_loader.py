@@ -1,31 +1,212 @@
 """
 Lightweight face verification using face_recognition library
-This uses dlib instead of TensorFlow - much lighter on memory!
+Detection uses dlib's HOG detector; encoding goes through the configured
+embedding backend (dlib by default, see backends.py).
 """
-import face_recognition
 import numpy as np
-from PIL import Image
+from pathlib import Path
+from typing import Union
 import logging
+import os
+import time
+from .backends import get_backend, verification_threshold
+from .preprocess import decode_image, detect_faces, scale_location, select_face
+from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+# Bundled face photo that every worker runs through the full pipeline at startup
+SAMPLE_IMAGE = Path(__file__).parent / "assets" / "sample_face.jpg"
+
+# Warm-up report of this process, filled once preload_model() succeeds
+_preload_report = {}
+
 def preload_model():
     """
-    Preload is not needed for face_recognition library
-    It's lightweight and loads instantly
+    Load the models this process serves and run them once on SAMPLE_IMAGE
+    
+    Detection, landmarking and encoding (plus age estimation when enabled)
+    all run for real, so lazy initialisation inside dlib and ONNX Runtime
+    happens here instead of in the first request. Safe to call repeatedly:
+    later calls return the first report.
+    
+    Returns:
+        dict: backend description with its per-image encode cost, model
+        load time and total warm-up time in milliseconds
     """
-    logger.info("Using face_recognition library (dlib-based)")
-    logger.info("✓ No preloading needed - library is lightweight")
-    return True
+    if _preload_report:
+        return _preload_report
+    
+    started = time.perf_counter()
+    backend = get_backend()
+    backend.load()
+    
+    face = detect_face(str(SAMPLE_IMAGE))
+    if face["crop"] is None:
+        raise RuntimeError(f"No face detected in warm-up sample {SAMPLE_IMAGE}")
+    backend.warm_up(face["crop"], face["crop_location"], min(settings.ENCODE_BATCH_SIZE, 4))
+    
+    report = backend.describe()
+    from .age import AgeModelUnavailable, age_enabled, estimate_age_batch
+    if age_enabled():
+        try:
+            report["sample_age"] = estimate_age_batch([face["crop"]])[0]
+        except AgeModelUnavailable as e:
+            # Verification still works, /verify/estimate-age answers 503
+            logger.error(f"Age estimation unavailable: {e}")
+    
+    report["warmup_ms"] = (time.perf_counter() - started) * 1000
+    _preload_report.update(report)
+    logger.info(f"✓ Embedding backend {backend.name} warmed up in {report['warmup_ms']:.0f}ms: {backend.cost}")
+    return _preload_report
 
-def verify_faces(image1_path: str, image2_path: str, threshold: float = 0.6):
+def report_warm_worker(hold: float = 0.2):
     """
-    Verify if two face images belong to the same person using face_recognition
+    Worker job: this process's pid and preload report
+    
+    The worker is held for a moment, so that jobs submitted together land
+    on different workers and each of them reports in.
+    """
+    report = preload_model()
+    time.sleep(hold)
+    return os.getpid(), report
+
+def preload_shared_models():
+    """
+    Load dlib's weights into a pre-fork master so every child shares them
+
+    Only loads: nothing runs inference and no ONNX Runtime session is
+    created, because thread pools started here would not survive fork().
+    Workers still call preload_model() to warm up in their own process.
+
+    Returns:
+        float: load time in milliseconds
+    """
+    started = time.perf_counter()
+    if settings.EMBEDDING_BACKEND == "dlib":
+        get_backend().load()
+    # Detection uses dlib's HOG detector whatever the embedding backend
+    import face_recognition.api  # noqa: F401
+    return (time.perf_counter() - started) * 1000
+
+def distance_confidence(face_distance: float) -> float:
+    """
+    Convert a face distance to a confidence score
+    
+    Distance ranges from 0 (identical) to the backend's max_distance (very
+    different); we normalize to 0-1 where 1 is high confidence match.
+    """
+    return max(0.0, min(1.0, 1 - (face_distance / get_backend().max_distance)))
+
+def compare_encodings(encoding1: np.ndarray, encoding2: np.ndarray, threshold: float = None):
+    """
+    Compare two face encodings
+    
+    The threshold defaults to verification_threshold() and confidence is
+    scaled by the active backend's distance range.
+    
+    Returns:
+        tuple: (result, confidence_score, face_distance)
+    """
+    if threshold is None:
+        threshold = verification_threshold()
+    
+    # Calculate face distance (lower = more similar)
+    face_distance = float(np.linalg.norm(encoding1 - encoding2))
+    confidence_score = distance_confidence(face_distance)
+    
+    # Determine match
+    is_match = face_distance < threshold
+    result = "match" if is_match else "no_match"
+    
+    return result, confidence_score, face_distance
+
+def crop_face(image: np.ndarray, location: tuple, margin: float = 0.5):
+    """
+    Cut a face out of an image with enough margin for landmarking
+    
+    Returns:
+        tuple: (crop, location relative to the crop)
+    """
+    top, right, bottom, left = location
+    height, width = bottom - top, right - left
+    y0 = max(0, int(top - height * margin))
+    y1 = min(image.shape[0], int(bottom + height * margin))
+    x0 = max(0, int(left - width * margin))
+    x1 = min(image.shape[1], int(right + width * margin))
+    
+    crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+    return crop, (top - y0, right - x0, bottom - y0, left - x0)
+
+def locate_face(image: np.ndarray, scale: float = 1.0) -> dict:
+    """
+    Locate the primary face of a decoded image and crop it for encoding
+    
+    Returns:
+        dict: crop, crop_location and location as for detect_face (None if
+        no face was found) and faces_found
+    """
+    locations, scores = detect_faces(image, settings.DETECT_MAX_SIDE)
+    face = {"crop": None, "crop_location": None, "location": None, "faces_found": len(locations)}
+    if len(locations) == 0:
+        return face
+    
+    primary = locations[select_face(locations, scores, image.shape, settings.FACE_SELECTION)]
+    face["crop"], face["crop_location"] = crop_face(image, primary)
+    face["location"] = scale_location(primary, scale)
+    return face
+
+def detect_face(source: Union[str, bytes]) -> dict:
+    """
+    Decode an image and locate its primary face
+    
+    Decoding and detection run at reduced resolution according to
+    DECODE_MAX_SIDE and DETECT_MAX_SIDE; FACE_SELECTION decides which face
+    is used when there are several.
+    
+    Args:
+        source: File path or raw image bytes
+    
+    Returns:
+        dict: crop and crop_location (ready for encode_face_batch, None if
+        no face was found), location in original image coordinates,
+        faces_found, and decode/detect timings in milliseconds
+    """
+    started = time.perf_counter()
+    image, scale = decode_image(source, settings.DECODE_MAX_SIDE)
+    decoded = time.perf_counter()
+    face = locate_face(image, scale)
+    detected = time.perf_counter()
+    
+    face["timings"] = {
+        "decode_ms": (decoded - started) * 1000,
+        "detect_ms": (detected - decoded) * 1000,
+    }
+    if face["crop"] is None:
+        logger.warning("No face detected in image")
+    return face
+
+def encode_face_batch(crops: list, locations: list):
+    """
+    Encode a batch of face crops in one call to the embedding backend
+    
+    Args:
+        crops: Face crops as returned by detect_face
+        locations: One face location per crop
+        
+    Returns:
+        list: One encoding per crop (128-d for dlib, 512-d for facenet512)
+    """
+    return get_backend().encode(crops, locations)
+
+def verify_faces(image1_path: str, image2_path: str, threshold: float = None):
+    """
+    Verify if two face images belong to the same person
     
     Args:
         image1_path: Path to first image
         image2_path: Path to second image
-        threshold: Distance threshold (default 0.6, lower = stricter)
+        threshold: Distance threshold (default: verification_threshold(), lower = stricter)
         
     Returns:
         tuple: (result, confidence_score)
@@ -36,37 +217,33 @@ def verify_faces(image1_path: str, image2_path: str, threshold: float = 0.6):
     
     try:
         # Load images
-        image1 = face_recognition.load_image_file(image1_path)
-        image2 = face_recognition.load_image_file(image2_path)
+        image1, _ = decode_image(image1_path)
+        image2, _ = decode_image(image2_path)
         
-        # Get face encodings
-        encodings1 = face_recognition.face_encodings(image1)
-        encodings2 = face_recognition.face_encodings(image2)
+        # Detect faces and pick the primary one in each image
+        locations1, scores1 = detect_faces(image1)
+        locations2, scores2 = detect_faces(image2)
         
         # Check if faces were detected
-        if len(encodings1) == 0:
+        if len(locations1) == 0:
             logger.warning(f"No face detected in {image1_path}")
             return "no_match", 0.0
             
-        if len(encodings2) == 0:
+        if len(locations2) == 0:
             logger.warning(f"No face detected in {image2_path}")
             return "no_match", 0.0
         
-        # Use the first face from each image
-        encoding1 = encodings1[0]
-        encoding2 = encodings2[0]
-        
-        # Calculate face distance (lower = more similar)
-        face_distance = face_recognition.face_distance([encoding1], encoding2)[0]
+        location1 = locations1[select_face(locations1, scores1, image1.shape, settings.FACE_SELECTION)]
+        location2 = locations2[select_face(locations2, scores2, image2.shape, settings.FACE_SELECTION)]
         
-        # Convert distance to confidence score
-        # Distance ranges from 0 (identical) to ~1.2 (very different)
-        # We normalize to 0-1 where 1 is high confidence match
-        confidence_score = max(0.0, min(1.0, 1 - (face_distance / 1.2)))
+        # Encode only the selected faces
+        crop1, crop_location1 = crop_face(image1, location1)
+        crop2, crop_location2 = crop_face(image2, location2)
+        encoding1, encoding2 = encode_face_batch([crop1, crop2], [crop_location1, crop_location2])
         
-        # Determine match
-        is_match = face_distance < threshold
-        result = "match" if is_match else "no_match"
+        if threshold is None:
+            threshold = verification_threshold()
+        result, confidence_score, face_distance = compare_encodings(encoding1, encoding2, threshold)
         
         logger.info(f"Verification result: {result}")
         logger.info(f"Face distance: {face_distance:.4f}, Threshold: {threshold:.4f}")
@@ -0,0 +1,263 @@
+"""
+Multi-frame verification with early exit
+Frames of a selfie burst or short clip are compared with one reference
+face. Uploaded frames are independent images and are visited coarse to
+fine (first, last, middle, quarters, ...); a clip is handed to a single
+worker job that walks forward through it once, because each GIF/APNG frame
+can only be decoded after the ones before it. Either way a running mean
+and spread of the distances to the reference is kept, and sampling stops
+as soon as the mean is MULTIFRAME_CONFIDENCE_Z standard errors away from
+the threshold on either side.
+"""
+import asyncio
+import logging
+import math
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+from ..config import settings
+from ..metrics import FRAMES_DECODED, NO_FACE_RESULTS, VERIFICATIONS
+from .backends import verification_threshold
+from .executor import inference_executor
+from .model_loader import distance_confidence, encode_face_batch, locate_face
+from .preprocess import iter_frames
+
+logger = logging.getLogger(__name__)
+
+# Floor on the estimated spread of frame distances, as a fraction of the
+# threshold, so two nearly identical frames do not look certain
+MIN_DISTANCE_SPREAD = 0.1
+
+
+def _candidates(frame_count: int, limit: int = 0) -> List[int]:
+    """All frame indices, or at most limit of them spread evenly over the whole clip"""
+    if limit and frame_count > limit:
+        step = (frame_count - 1) / max(limit - 1, 1)
+        return sorted({round(i * step) for i in range(limit)})
+    return list(range(frame_count))
+
+
+def sampling_order(frame_count: int, limit: int = 0) -> List[int]:
+    """
+    Frame indices, coarse to fine: first, last, then repeated bisection
+
+    With a limit, at most that many indices are returned, spread evenly
+    over the whole clip.
+    """
+    if frame_count <= 0:
+        return []
+    candidates = _candidates(frame_count, limit)
+
+    order = [0, len(candidates) - 1] if len(candidates) > 1 else [0]
+    seen = set(order)
+    intervals = [(0, len(candidates) - 1)]
+    while intervals:
+        next_intervals = []
+        for low, high in intervals:
+            if high - low < 2:
+                continue
+            middle = (low + high) // 2
+            if middle not in seen:
+                seen.add(middle)
+                order.append(middle)
+            next_intervals += [(low, middle), (middle, high)]
+        intervals = next_intervals
+    return [candidates[i] for i in order]
+
+
+class RunningDistance:
+    """Mean and variance of frame distances (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, distance: float):
+        self.count += 1
+        delta = distance - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (distance - self.mean)
+
+    def standard_error(self, min_spread: float) -> float:
+        variance = self._m2 / (self.count - 1) if self.count > 1 else 0.0
+        return max(math.sqrt(variance), min_spread) / math.sqrt(self.count)
+
+    def decision(self, threshold: float, z: float, min_frames: int) -> Optional[str]:
+        """match or no_match once the mean is clearly on one side of threshold, else None"""
+        if self.count < min_frames:
+            return None
+        margin = z * self.standard_error(MIN_DISTANCE_SPREAD * threshold)
+        if self.mean + margin < threshold:
+            return "match"
+        if self.mean - margin > threshold:
+            return "no_match"
+        return None
+
+
+async def verify_frames_async(
+    reference: dict,
+    frame_count: int,
+    load_face: Callable[[int], Awaitable[dict]],
+    threshold: Optional[float] = None,
+) -> dict:
+    """
+    Compare a reference face with separately uploaded frames, stopping early
+
+    The first MULTIFRAME_MIN_FRAMES frames are processed concurrently,
+    later ones one at a time so nothing past the stopping point is decoded.
+    Frames without a face are skipped.
+
+    Args:
+        reference: Face of the reference image, as returned by get_face
+        frame_count: Number of frames
+        load_face: Returns the face (see get_face) of the frame at an index
+
+    Returns:
+        dict: result, confidence_score, mean_distance, frames_total,
+        frames_decoded, frames_with_face, early_exit and the distance of
+        every decoded frame (None for frames without a face)
+    """
+    if threshold is None:
+        threshold = verification_threshold()
+    order = sampling_order(frame_count, settings.MULTIFRAME_MAX_FRAMES)
+    min_frames = max(1, settings.MULTIFRAME_MIN_FRAMES)
+
+    outcome = _empty_outcome(frame_count)
+    if reference["encoding"] is None:
+        NO_FACE_RESULTS.inc()
+        VERIFICATIONS.inc(result="no_match")
+        return outcome
+
+    running = RunningDistance()
+    decision = None
+    position = 0
+    while position < len(order) and decision is None:
+        wave = order[position:position + (min_frames if position == 0 else 1)]
+        position += len(wave)
+        faces = await asyncio.gather(*(load_face(index) for index in wave))
+
+        for index, face in zip(wave, faces):
+            distance = None
+            if face["encoding"] is not None:
+                distance = float(np.linalg.norm(face["encoding"] - reference["encoding"]))
+                running.add(distance)
+            outcome["frames"].append({"index": index, "distance": distance})
+        decision = running.decision(threshold, settings.MULTIFRAME_CONFIDENCE_Z, min_frames)
+
+    return _finish(outcome, running, decision, threshold, decoded=position, early_exit=position < len(order))
+
+
+def scan_clip(clip: bytes, frame_count: int, reference: np.ndarray, threshold: float) -> dict:
+    """
+    Worker job: encode sampled frames of a clip until the decision is clear
+
+    The clip is walked forward once; the sampled frames are evenly spaced
+    and in increasing order, so every frame is decoded at most once and
+    nothing after the stopping frame is decoded at all.
+
+    Returns:
+        dict: running (RunningDistance), decision, frames (index and distance
+        of each sampled frame), frames_sampled, frames_decoded (every frame
+        up to the last sampled one) and early_exit
+    """
+    indices = _candidates(frame_count, settings.MULTIFRAME_MAX_FRAMES)
+    min_frames = max(1, settings.MULTIFRAME_MIN_FRAMES)
+    running = RunningDistance()
+    decision = None
+    frames = []
+    last_index = -1
+
+    for index, image, scale in iter_frames(clip, indices, settings.DECODE_MAX_SIDE):
+        last_index = index
+        face = locate_face(image, scale)
+        distance = None
+        if face["crop"] is not None:
+            encoding = encode_face_batch([face["crop"]], [face["crop_location"]])[0]
+            distance = float(np.linalg.norm(encoding - reference))
+            running.add(distance)
+        frames.append({"index": index, "distance": distance})
+        decision = running.decision(threshold, settings.MULTIFRAME_CONFIDENCE_Z, min_frames)
+        if decision is not None:
+            break
+
+    return {
+        "running": running,
+        "decision": decision,
+        "frames": frames,
+        "frames_sampled": len(frames),
+        "frames_decoded": last_index + 1,
+        "early_exit": decision is not None and len(frames) < len(indices),
+    }
+
+
+async def verify_clip_async(
+    reference: dict,
+    clip: bytes,
+    frame_count: int,
+    threshold: Optional[float] = None,
+) -> dict:
+    """
+    Compare a reference face with the frames of an animated GIF or PNG
+
+    The clip is sent to one inference worker, see scan_clip.
+
+    Returns:
+        dict: as for verify_frames_async; frames_decoded counts every frame
+        the worker decoded, including those skipped between samples
+    """
+    if threshold is None:
+        threshold = verification_threshold()
+    outcome = _empty_outcome(frame_count)
+    if reference["encoding"] is None:
+        NO_FACE_RESULTS.inc()
+        VERIFICATIONS.inc(result="no_match")
+        return outcome
+
+    scan = await inference_executor.run(scan_clip, clip, frame_count, reference["encoding"], threshold)
+    outcome["frames"] = scan["frames"]
+    return _finish(
+        outcome, scan["running"], scan["decision"], threshold,
+        decoded=scan["frames_decoded"], early_exit=scan["early_exit"],
+    )
+
+
+def _empty_outcome(frame_count: int) -> dict:
+    return {
+        "result": "no_match",
+        "confidence_score": 0.0,
+        "mean_distance": None,
+        "frames_total": frame_count,
+        "frames_decoded": 0,
+        "frames_with_face": 0,
+        "early_exit": False,
+        "frames": [],
+    }
+
+
+def _finish(outcome: dict, running: RunningDistance, decision: Optional[str], threshold: float, decoded: int, early_exit: bool) -> dict:
+    """Fill in the result once sampling has stopped and record metrics"""
+    outcome["frames_decoded"] = decoded
+    outcome["frames_with_face"] = running.count
+    FRAMES_DECODED.observe(decoded)
+
+    if not running.count:
+        NO_FACE_RESULTS.inc()
+        VERIFICATIONS.inc(result="no_match")
+        return outcome
+
+    # Out of frames without a clear decision: fall back to the mean
+    result = decision or ("match" if running.mean < threshold else "no_match")
+    VERIFICATIONS.inc(result=result)
+    outcome.update(
+        result=result,
+        confidence_score=distance_confidence(running.mean),
+        mean_distance=running.mean,
+        early_exit=decision is not None and early_exit,
+    )
+    logger.info(
+        f"Multi-frame verification: {result} after decoding {decoded}/{outcome['frames_total']} frames, "
+        f"mean distance {running.mean:.4f}, threshold {threshold:.4f}"
+    )
+    return outcome
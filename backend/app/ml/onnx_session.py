@@ -0,0 +1,26 @@
+"""
+Shared ONNX Runtime session setup for the optional ONNX models
+onnxruntime is imported lazily so the dlib-only deployment does not need it.
+"""
+import os
+
+
+class ModelUnavailable(Exception):
+    """Raised when an ONNX model is not configured or cannot be loaded"""
+
+
+def create_session(model_path: str, threads: int = 1):
+    """ONNX Runtime CPU session for an exported (optionally quantized) model"""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise ModelUnavailable("onnxruntime is not installed")
+    if not os.path.exists(model_path):
+        raise ModelUnavailable(f"Model not found: {model_path}")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # Inference workers are separate processes, so each session gets few threads
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
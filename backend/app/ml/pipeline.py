@@ -0,0 +1,134 @@
+"""
+Async verification pipeline
+Detection runs per image in the inference workers, encoding goes through
+the micro-batcher so concurrent requests share a forward pass. With an age
+model configured the same crop is batched through the age model alongside.
+"""
+import asyncio
+import logging
+from typing import Optional, Union
+
+import numpy as np
+
+from ..metrics import FACES_DETECTED, NO_FACE_RESULTS, STAGE_DURATION, VERIFICATIONS, stage
+from .age import age_enabled
+from .backends import verification_threshold
+from .batcher import age_batcher, encoding_batcher
+from .embedding_cache import embedding_cache, image_digest
+from .executor import inference_executor
+from .model_loader import compare_encodings, detect_face
+
+logger = logging.getLogger(__name__)
+
+
+async def _estimate_age(crop: np.ndarray, location: tuple) -> Optional[float]:
+    """Age for a face crop; a failing age model must not fail the verification"""
+    try:
+        with stage("age"):
+            return await age_batcher.encode(crop, location)
+    except Exception as e:
+        logger.warning(f"Age estimation failed: {e}")
+        return None
+
+
+async def detect_and_encode(image: Union[str, bytes]) -> dict:
+    """
+    Detect and encode the primary face in an image given as a path or raw bytes
+
+    Returns:
+        dict: location, encoding (both None if no face was found), faces_found
+        and age (None unless age estimation is enabled)
+    """
+    face = await inference_executor.run(detect_face, image)
+    for name, value in face["timings"].items():
+        STAGE_DURATION.observe(value / 1000, stage=name[:-3])
+    FACES_DETECTED.observe(face["faces_found"])
+
+    result = {"location": face["location"], "encoding": None, "faces_found": face["faces_found"], "age": None}
+    if face["crop"] is None:
+        return result
+
+    if age_enabled():
+        with stage("encode"):
+            result["encoding"], result["age"] = await asyncio.gather(
+                encoding_batcher.encode(face["crop"], face["crop_location"]),
+                _estimate_age(face["crop"], face["crop_location"]),
+            )
+    else:
+        with stage("encode"):
+            result["encoding"] = await encoding_batcher.encode(face["crop"], face["crop_location"])
+    return result
+
+
+async def get_face(image: Union[str, bytes], digest: Optional[str] = None) -> dict:
+    """
+    Primary face of an image, see detect_and_encode
+
+    Raw bytes are hashed for the embedding cache; for paths the SHA-256
+    digest of the file contents may be passed in explicitly.
+    """
+    if digest is None and isinstance(image, (bytes, bytearray)):
+        digest = image_digest(image)
+
+    if digest is None or not embedding_cache.enabled:
+        return await detect_and_encode(image)
+    return await embedding_cache.get_or_compute(digest, lambda: detect_and_encode(image))
+
+
+async def get_face_encoding(image: Union[str, bytes], digest: Optional[str] = None) -> Optional[np.ndarray]:
+    """Encoding of the primary face in an image, None if no face was found"""
+    face = await get_face(image, digest)
+    return face["encoding"]
+
+
+async def get_face_age(image: Union[str, bytes]) -> dict:
+    """
+    Primary face of an image including its estimated age
+
+    Cache entries made before age estimation was enabled carry no age, so
+    those images are processed again.
+    """
+    face = await get_face(image)
+    if face["encoding"] is not None and face.get("age") is None:
+        face = await detect_and_encode(image)
+    return face
+
+
+def face_summary(face: dict) -> dict:
+    """Which face was used, how many were found and its age, for API responses"""
+    return {
+        "location": list(face["location"]) if face["location"] is not None else None,
+        "faces_found": face["faces_found"],
+        "age": face.get("age"),
+    }
+
+
+async def verify_faces_async(image1: Union[str, bytes], image2: Union[str, bytes], threshold: Optional[float] = None):
+    """
+    Async counterpart of model_loader.verify_faces
+
+    Images may be file paths or raw bytes; bytes are decoded in memory by
+    the inference workers and looked up in the embedding cache.
+
+    Returns:
+        tuple: (result, confidence_score, faces) where faces holds a
+        face_summary for each image
+    """
+    if threshold is None:
+        threshold = verification_threshold()
+    face1, face2 = await asyncio.gather(get_face(image1), get_face(image2))
+    faces = (face_summary(face1), face_summary(face2))
+
+    if face1["encoding"] is None or face2["encoding"] is None:
+        NO_FACE_RESULTS.inc()
+        VERIFICATIONS.inc(result="no_match")
+        return "no_match", 0.0, faces
+
+    result, confidence_score, face_distance = compare_encodings(face1["encoding"], face2["encoding"], threshold)
+    VERIFICATIONS.inc(result=result)
+
+    logger.info(f"Verification result: {result}")
+    logger.info(f"Face distance: {face_distance:.4f}, Threshold: {threshold:.4f}")
+    logger.info(f"Confidence: {confidence_score:.4f}")
+
+    return result, confidence_score, faces
@@ -0,0 +1,148 @@
+"""
+Resolution-aware image decoding and face detection
+Large JPEGs are decoded at a reduced scale with PIL's draft mode and HOG
+detection runs on a downscaled copy; boxes are mapped back so landmarks
+and encodings still see the higher-resolution pixels. When several faces
+are found, select_face picks the one to encode.
+"""
+import io
+import logging
+from typing import Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+logger = logging.getLogger(__name__)
+
+SELECTION_POLICIES = ("largest", "central", "score")
+
+
+def decode_image(source: Union[str, bytes], max_side: int = 0) -> Tuple[np.ndarray, float]:
+    """
+    Decode an image into an RGB array
+
+    JPEGs whose longest side is at least twice max_side are decoded with
+    DCT scaling (1/2, 1/4 or 1/8), never going below max_side.
+
+    Returns:
+        tuple: (image, scale) where scale = original size / decoded size
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    image = Image.open(source)
+    original_width = image.width
+
+    if max_side and image.format == "JPEG" and max(image.size) >= 2 * max_side:
+        ratio = max_side / max(image.size)
+        image.draft("RGB", (int(image.width * ratio), int(image.height * ratio)))
+
+    image = image.convert("RGB")
+    return np.array(image), original_width / image.width
+
+
+def iter_frames(source: Union[str, bytes], indices: Iterable[int], max_side: int = 0) -> Iterator[Tuple[int, np.ndarray, float]]:
+    """
+    Decode the given frames of an animated GIF or PNG, walking forward once
+
+    GIF and APNG frames are deltas of the previous ones, so every frame up
+    to the last requested index is decoded exactly once; nothing past the
+    point where the caller stops iterating is read. Yielded frames are
+    shrunk so their longest side is at most max_side.
+
+    Yields:
+        tuple: (index, image, scale) with scale as for decode_image
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    wanted = sorted(set(indices))
+    if not wanted:
+        return
+    with Image.open(source) as clip:
+        position = 0
+        for index, frame in enumerate(ImageSequence.Iterator(clip)):
+            if index != wanted[position]:
+                continue
+            image = frame.convert("RGB")
+            original_width = image.width
+            if max_side and max(image.size) > max_side:
+                image.thumbnail((max_side, max_side), Image.BILINEAR)
+            yield index, np.array(image), original_width / image.width
+            position += 1
+            if position == len(wanted):
+                return
+
+
+def _hog_detect(image: np.ndarray) -> Tuple[List[tuple], List[float]]:
+    # Importing face_recognition loads dlib's weights, only inference workers need them
+    from face_recognition.api import _rect_to_css, _trim_css_to_bounds, face_detector
+
+    rects, scores, _ = face_detector.run(image, 1, 0.0)
+    locations = [_trim_css_to_bounds(_rect_to_css(rect), image.shape) for rect in rects]
+    return locations, list(scores)
+
+
+def detect_faces(image: np.ndarray, max_side: int = 0) -> Tuple[List[tuple], List[float]]:
+    """
+    Run HOG face detection on a copy no larger than max_side
+
+    Returns:
+        tuple: (locations, scores) with locations as (top, right, bottom, left)
+        in image coordinates and one detector score per location
+    """
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return _hog_detect(image)
+
+    ratio = max_side / max(height, width)
+    small = Image.fromarray(image).resize(
+        (max(1, round(width * ratio)), max(1, round(height * ratio))),
+        Image.BILINEAR,
+    )
+    locations, scores = _hog_detect(np.asarray(small))
+
+    locations = [
+        (
+            max(0, int(top / ratio)),
+            min(width, int(right / ratio)),
+            min(height, int(bottom / ratio)),
+            max(0, int(left / ratio)),
+        )
+        for top, right, bottom, left in locations
+    ]
+    return locations, scores
+
+
+def select_face(locations: List[tuple], scores: List[float], image_shape: tuple, policy: str = "largest") -> int:
+    """
+    Index of the primary face among several detections
+
+    Policies:
+        largest: biggest box area
+        central: box centre closest to the image centre
+        score: highest detector score
+    Ties go to the earlier detection, so the choice is deterministic.
+    """
+    if policy not in SELECTION_POLICIES:
+        raise ValueError(f"Unknown face selection policy: {policy}")
+
+    if policy == "score":
+        keys = [-score for score in scores]
+    elif policy == "central":
+        centre_y, centre_x = image_shape[0] / 2, image_shape[1] / 2
+        keys = [
+            ((top + bottom) / 2 - centre_y) ** 2 + ((left + right) / 2 - centre_x) ** 2
+            for top, right, bottom, left in locations
+        ]
+    else:
+        keys = [-(bottom - top) * (right - left) for top, right, bottom, left in locations]
+
+    return min(range(len(locations)), key=lambda i: keys[i])
+
+
+def scale_location(location: tuple, scale: float) -> tuple:
+    """Map a face location from decoded to original image coordinates"""
+    if scale == 1:
+        return tuple(location)
+    return tuple(int(round(v * scale)) for v in location)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -45,8 +45,73 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class FaceSelection(BaseModel):
+    location: Optional[List[int]] = None  # top, right, bottom, left
+    faces_found: int
+    age: Optional[float] = None  # Only when age estimation is enabled
+
+class AgeEstimate(BaseModel):
+    age: float
+    location: List[int]  # top, right, bottom, left
+    faces_found: int
+
 class VerificationResult(BaseModel):
     result: str
     confidence_score: float
     message: str
-    verification_id: str
\ No newline at end of file
+    verification_id: str
+    image1_face: Optional[FaceSelection] = None
+    image2_face: Optional[FaceSelection] = None
+
+class FrameDistance(BaseModel):
+    index: int
+    distance: Optional[float] = None  # None when the frame has no face
+
+class MultiFrameResult(BaseModel):
+    result: str
+    confidence_score: float
+    message: str
+    verification_id: str
+    mean_distance: Optional[float] = None
+    frames_total: int
+    frames_decoded: int
+    frames_with_face: int
+    early_exit: bool  # Decided before every sampled frame was decoded
+    frames: List[FrameDistance]  # In the order they were sampled
+    reference_face: Optional[FaceSelection] = None
+
+class VerificationJob(BaseModel):
+    job_id: str
+    status: str  # queued, running, done or failed
+    priority: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[VerificationResult] = None
+    error: Optional[str] = None
+
+class VerificationStats(BaseModel):
+    total: int
+    results: Dict[str, int]  # count per result (match, no_match)
+    match_rate: Optional[float] = None
+    mean_confidence: Optional[float] = None
+    confidence_histogram: List[int]  # count per confidence bucket of width 1 / len(histogram)
+    first_verification_at: Optional[datetime] = None
+    last_verification_at: Optional[datetime] = None
+
+class GalleryEnrollResult(BaseModel):
+    person_id: str
+    enrolled: int
+    skipped: List[str] = []
+    total_encodings: int
+
+class GalleryMatch(BaseModel):
+    person_id: str
+    result: str
+    similarity: float
+    distance: float
+    confidence_score: float
+
+class GalleryIdentifyResult(BaseModel):
+    matches: List[GalleryMatch]
+    gallery_size: int
@@ -0,0 +1,128 @@
+"""
+Pre-fork server: load the models once, then fork the HTTP workers
+The master imports the app and dlib's weights, freezes the GC so the
+shared objects are not dirtied by collections, binds the socket and forks
+SERVE_WORKERS uvicorn workers. Workers (and the inference processes they
+fork in turn) share those pages copy-on-write instead of each loading its
+own copy. Every worker connects to Mongo in its own lifespan; the master
+never does, and restarts workers that die.
+
+Usage (from backend/):
+    python -m app.serve --host 0.0.0.0 --port 10000 --workers 4
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting is restarted only after a pause
+MIN_WORKER_UPTIME = 5.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the face verification API from pre-forked workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "10000")))
+    parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS, help="HTTP worker processes (default: SERVE_WORKERS)")
+    return parser.parse_args()
+
+
+def run_worker(config, sock):
+    """Body of a forked HTTP worker, never returns"""
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        logger.error(f"Worker {os.getpid()} crashed: {e}")
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+def main():
+    args = parse_args()
+    workers = max(1, args.workers)
+    if not settings.INFERENCE_WORKERS:
+        # Split the cores between the HTTP workers' inference pools
+        settings.INFERENCE_WORKERS = max(1, (os.cpu_count() or 1) // workers)
+
+    import uvicorn
+
+    started = time.perf_counter()
+    from .main import app
+    from .ml.executor import inference_executor
+    from .ml.model_loader import preload_shared_models
+
+    # Inference workers fork from the HTTP workers and inherit the models too
+    inference_executor.start_method = "fork"
+    load_ms = preload_shared_models()
+    logger.info(
+        f"✓ Master {os.getpid()} loaded the app and models in {(time.perf_counter() - started) * 1000:.0f}ms "
+        f"(models {load_ms:.0f}ms), forking {workers} workers x {inference_executor.workers} inference processes"
+    )
+
+    # Everything allocated so far is shared; keep the GC from writing to it
+    gc.collect()
+    gc.freeze()
+
+    config = uvicorn.Config(app, host=args.host, port=args.port, lifespan="on")
+    sock = config.bind_socket()
+
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(config, sock)
+        children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started_at = children.pop(pid, None)
+        if started_at is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        if time.monotonic() - started_at < MIN_WORKER_UPTIME:
+            time.sleep(MIN_WORKER_UPTIME)
+        if not stopping:
+            spawn()
+
+    sock.close()
+    logger.info("✓ All workers stopped")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
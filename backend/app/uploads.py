@@ -0,0 +1,266 @@
+"""
+Upload limits and header-only image checks
+Request bodies are capped while they stream in, images are read in chunks
+up to MAX_FILE_SIZE, sniffed from their magic bytes and probed for their
+dimensions from the header alone. Oversized, non-image and decompression
+bomb uploads are refused before anything is decoded or sent to a worker.
+save_uploads() keeps audit copies of accepted images.
+"""
+import io
+import logging
+import warnings
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from .config import settings
+from .metrics import UPLOADS_REJECTED
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the formats the API accepts
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "JPEG",
+    b"\x89PNG\r\n\x1a\n": "PNG",
+}
+
+# Animated formats accepted as clips by /verify/frames (PNG covers APNG)
+CLIP_SIGNATURES = {
+    b"GIF87a": "GIF",
+    b"GIF89a": "GIF",
+    b"\x89PNG\r\n\x1a\n": "PNG",
+}
+
+
+class ImageRejected(ValueError):
+    """Raised for an upload that is too large or not a usable image"""
+
+    def __init__(self, message: str, reason: str, status_code: int = status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.reason = reason
+        self.status_code = status_code
+        UPLOADS_REJECTED.inc(reason=reason)
+
+
+def _too_large(size: int, limit: int = 0) -> ImageRejected:
+    return ImageRejected(
+        f"File is larger than the {(limit or settings.MAX_FILE_SIZE) / (1024 * 1024):g}MB limit ({size} bytes read)",
+        "size",
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+
+
+def _too_many_pixels(size: str = "") -> ImageRejected:
+    return ImageRejected(
+        f"Image has too many pixels{f' ({size})' if size else ''}, the limit is {settings.MAX_IMAGE_PIXELS}",
+        "pixels",
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    )
+
+
+def sniff_format(header: bytes, signatures: Dict[bytes, str] = IMAGE_SIGNATURES) -> Optional[str]:
+    """Image format from the first bytes of a file, None if not one of signatures"""
+    for signature, image_format in signatures.items():
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def probe_image(data: bytes) -> Tuple[str, int, int]:
+    """
+    Format and dimensions of an image without decoding its pixels
+
+    PIL only parses the header on open; the pixel count is checked against
+    MAX_IMAGE_PIXELS before anything would allocate the full bitmap.
+
+    Returns:
+        tuple: (format, width, height)
+
+    Raises:
+        ImageRejected: if the data is not a readable JPEG/PNG or has too many pixels
+    """
+    image_format = sniff_format(data[:8])
+    if image_format is None:
+        raise ImageRejected(
+            "File content is not a JPEG or PNG image", "type", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
+    try:
+        with warnings.catch_warnings():
+            # Our own limit applies below, PIL's warning would only add noise
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data), formats=[image_format]) as image:
+                width, height = image.size
+    except Image.DecompressionBombError:
+        raise _too_many_pixels()
+    except Exception:
+        raise ImageRejected(f"{image_format} header could not be read", "corrupt")
+
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise _too_many_pixels(f"{width}x{height}")
+    if width * height == 0:
+        raise ImageRejected("Image is empty", "corrupt")
+    return image_format, width, height
+
+
+def probe_clip(data: bytes) -> Tuple[str, int, int, int]:
+    """
+    Format, frame size and frame count of an animated GIF or PNG
+
+    Like probe_image, frames are counted from the file structure without
+    decoding any pixels. A still image is a clip of one frame. Clips with
+    more than MULTIFRAME_MAX_FRAMES frames, or more than
+    MULTIFRAME_MAX_CLIP_PIXELS pixels over all frames, are refused: a clip
+    is decoded in one inference job that cannot be interrupted.
+
+    Returns:
+        tuple: (format, width, height, frames)
+
+    Raises:
+        ImageRejected: if the data is not a readable GIF/PNG, has too many
+        frames, or its frames have too many pixels
+    """
+    clip_format = sniff_format(data[:8], CLIP_SIGNATURES)
+    if clip_format is None:
+        raise ImageRejected(
+            "Clip is not an animated GIF or PNG", "type", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data), formats=[clip_format]) as image:
+                width, height = image.size
+                frames = getattr(image, "n_frames", 1)
+    except Image.DecompressionBombError:
+        raise _too_many_pixels()
+    except Exception:
+        raise ImageRejected(f"{clip_format} clip could not be read", "corrupt")
+
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise _too_many_pixels(f"{width}x{height}")
+    if width * height == 0 or frames == 0:
+        raise ImageRejected("Clip is empty", "corrupt")
+    if frames > settings.MULTIFRAME_MAX_FRAMES:
+        raise ImageRejected(
+            f"Clip has {frames} frames, the limit is {settings.MULTIFRAME_MAX_FRAMES}",
+            "frames",
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    if width * height * frames > settings.MULTIFRAME_MAX_CLIP_PIXELS:
+        raise ImageRejected(
+            f"Clip has too many pixels ({frames} frames of {width}x{height}), "
+            f"the limit is {settings.MULTIFRAME_MAX_CLIP_PIXELS} over all frames",
+            "pixels",
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+    return clip_format, width, height, frames
+
+
+def check_image_bytes(data: bytes) -> bytes:
+    """Apply the size cap and header probe to an image that is already in memory"""
+    if len(data) > settings.MAX_FILE_SIZE:
+        raise _too_large(len(data))
+    probe_image(data)
+    return data
+
+
+async def read_upload(upload: UploadFile, max_size: int = 0, signatures: Dict[bytes, str] = IMAGE_SIGNATURES) -> bytes:
+    """
+    Read an uploaded image in chunks, stopping as soon as it breaks a limit
+
+    The first chunk is sniffed before anything else is read, and reading
+    stops once max_size (default MAX_FILE_SIZE) is exceeded. Still images
+    are probed as well; callers reading clips with CLIP_SIGNATURES probe
+    them with probe_clip.
+
+    Raises:
+        ImageRejected: for oversized, non-image or undecodable headers
+    """
+    max_size = max_size or settings.MAX_FILE_SIZE
+    if upload.size is not None and upload.size > max_size:
+        raise _too_large(upload.size, max_size)
+
+    chunks, size = [], 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not chunks and sniff_format(chunk, signatures) is None:
+            raise ImageRejected(
+                f"File content is not a {' or '.join(sorted(set(signatures.values())))} image",
+                "type",
+                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        size += len(chunk)
+        if size > max_size:
+            raise _too_large(size, max_size)
+        chunks.append(chunk)
+
+    data = b"".join(chunks)
+    if signatures is IMAGE_SIGNATURES:
+        probe_image(data)
+    return data
+
+
+def save_uploads(*uploads: tuple):
+    """Write (path, bytes) pairs to disk for auditing, run after the response is sent"""
+    for path, data in uploads:
+        try:
+            with open(path, "wb") as buffer:
+                buffer.write(data)
+        except OSError as e:
+            logger.error(f"Could not save upload {path}: {e}")
+
+
+class RequestSizeLimit:
+    """
+    ASGI middleware capping request bodies before they are parsed
+
+    A Content-Length over the limit is answered with 413 straight away;
+    bodies without one are counted as they stream in and cut off once they
+    pass it. `overrides` maps exact paths to their own limit.
+    """
+
+    def __init__(self, app, max_size: int, overrides: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_size = max_size
+        self.overrides = overrides or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.overrides.get(scope["path"], self.max_size)
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than the {limit / (1024 * 1024):g}MB limit"
+        declared = Headers(scope=scope).get("content-length", "")
+        if declared.isdigit() and int(declared) > limit:
+            UPLOADS_REJECTED.inc(reason="request_size")
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    UPLOADS_REJECTED.inc(reason="request_size")
+                    # Raised inside body parsing, FastAPI passes HTTPException through
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,137 @@
+"""
+Batch verification
+Runs many image pairs in one request, encoding each distinct image once
+and yielding one result per pair as soon as it is known.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List
+
+from bson import ObjectId
+
+from ..admission import admission
+from ..config import settings
+from ..database import create_verification_records
+from ..ml.embedding_cache import image_digest
+from ..ml.executor import inference_executor
+from ..ml.model_loader import compare_encodings
+from ..ml.pipeline import get_face_encoding
+
+logger = logging.getLogger(__name__)
+
+# History records are written in chunks of this size
+INSERT_CHUNK_SIZE = 100
+
+
+class BatchError(Exception):
+    """Raised for a malformed batch manifest"""
+
+
+def parse_manifest(raw: str) -> List[dict]:
+    """
+    Parse a batch manifest
+
+    Accepts a JSON list of {"image1": name, "image2": name, "id": optional}
+    objects, or an object with that list under "pairs".
+    """
+    try:
+        manifest = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise BatchError(f"Manifest is not valid JSON: {e}")
+
+    pairs = manifest.get("pairs") if isinstance(manifest, dict) else manifest
+    if not isinstance(pairs, list) or not pairs:
+        raise BatchError("Manifest must contain a non-empty list of pairs")
+    if len(pairs) > settings.BATCH_MAX_PAIRS:
+        raise BatchError(f"Too many pairs ({len(pairs)}), the limit is {settings.BATCH_MAX_PAIRS}")
+
+    for i, pair in enumerate(pairs):
+        if not isinstance(pair, dict) or not isinstance(pair.get("image1"), str) or not isinstance(pair.get("image2"), str):
+            raise BatchError(f"Pair {i} must have string 'image1' and 'image2' fields")
+
+    return pairs
+
+
+async def run_batch(
+    pairs: List[dict],
+    read_image: Callable[[str], Awaitable[bytes]],
+    user_id: str,
+) -> AsyncIterator[dict]:
+    """
+    Verify every pair, yielding result dicts in completion order
+
+    read_image(name) returns the bytes of a named image and raises KeyError
+    if it is missing. Each distinct name is read and encoded once, and
+    images with identical bytes share an encoding through the cache.
+    """
+    # Keep the executor busy without overflowing its submission queue
+    limit = asyncio.Semaphore(inference_executor.workers * 2)
+    encodings: Dict[str, asyncio.Future] = {}
+
+    async def encode(name: str):
+        async with limit:
+            data = await read_image(name)
+            # Share inference fairly with other users instead of flooding it
+            async with admission.admit(user_id, cost=0, shed=False):
+                return await get_face_encoding(data, image_digest(data))
+
+    def encoding_for(name: str) -> asyncio.Future:
+        if name not in encodings:
+            encodings[name] = asyncio.ensure_future(encode(name))
+        return encodings[name]
+
+    async def verify_pair(index: int, pair: dict) -> dict:
+        line = {"index": index, "id": pair.get("id"), "image1": pair["image1"], "image2": pair["image2"]}
+        try:
+            encoding1, encoding2 = await asyncio.gather(
+                asyncio.shield(encoding_for(pair["image1"])),
+                asyncio.shield(encoding_for(pair["image2"])),
+            )
+        except KeyError as e:
+            line["error"] = f"Image not found in batch: {e.args[0]}"
+            return line
+        except Exception as e:
+            line["error"] = f"Verification failed: {e}"
+            return line
+
+        if encoding1 is None or encoding2 is None:
+            result, confidence, distance = "no_match", 0.0, None
+        else:
+            result, confidence, distance = compare_encodings(encoding1, encoding2)
+
+        line.update(result=result, confidence_score=confidence, distance=distance)
+        return line
+
+    tasks = [asyncio.ensure_future(verify_pair(i, pair)) for i, pair in enumerate(pairs)]
+    records = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            if "error" not in line:
+                record_id = ObjectId()
+                records.append({
+                    "_id": record_id,
+                    "user_id": user_id,
+                    "image1_filename": line["image1"],
+                    "image2_filename": line["image2"],
+                    "result": line["result"],
+                    "confidence_score": float(line["confidence_score"]),
+                    "created_at": datetime.utcnow()
+                })
+                line["verification_id"] = str(record_id)
+
+            if len(records) >= INSERT_CHUNK_SIZE:
+                await create_verification_records(records)
+                records = []
+
+            yield line
+
+        await create_verification_records(records)
+        logger.info(f"Batch of {len(pairs)} pairs finished, {len(encodings)} distinct images encoded")
+    finally:
+        for task in tasks:
+            task.cancel()
+        for future in encodings.values():
+            future.cancel()
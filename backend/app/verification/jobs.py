@@ -0,0 +1,229 @@
+"""
+Asynchronous verification jobs
+POST /verify/jobs stores a queued job in Mongo and returns at once; a
+fixed number of job workers in this process take jobs in priority order,
+run them through the same pipeline as /verify/ and write the outcome back
+to the job document, where clients poll it or follow it over SSE.
+"""
+import asyncio
+import itertools
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from fastapi.concurrency import run_in_threadpool
+
+from ..admission import admission
+from ..config import settings
+from ..database import create_verification_job, create_verification_record, fail_verification_jobs, update_verification_job
+from ..metrics import stage
+from ..ml.executor import InferenceQueueFull, inference_executor
+from ..ml.pipeline import verify_faces_async
+from ..schemas import VerificationResult
+from ..uploads import save_uploads
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("done", "failed")
+
+# Seconds between job workers retrying a job the inference queue turned away
+BUSY_RETRY_DELAY = 0.5
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_QUEUE_SIZE jobs are already waiting"""
+
+
+async def verify_and_record(user_id: str, uploads: Tuple[Tuple[Path, bytes], Tuple[Path, bytes]]) -> VerificationResult:
+    """
+    Verify two images and store the history record
+
+    Args:
+        uploads: (path, bytes) per image; the file names go into the record
+
+    Raises:
+        InferenceQueueFull, InferenceTimeout: from the inference executor
+    """
+    (image1_path, image1_bytes), (image2_path, image2_bytes) = uploads
+    result, confidence, (image1_face, image2_face) = await verify_faces_async(image1_bytes, image2_bytes)
+
+    with stage("db_insert"):
+        verification_record = await create_verification_record(
+            user_id=user_id,
+            image1_filename=image1_path.name,
+            image2_filename=image2_path.name,
+            result=result,
+            confidence_score=confidence
+        )
+
+    message = (
+        f"Same person detected! (Confidence: {confidence:.2%})"
+        if result == "match"
+        else f"Different persons detected. (Confidence: {confidence:.2%})"
+    )
+
+    return VerificationResult(
+        result=result,
+        confidence_score=confidence,
+        message=message,
+        verification_id=str(verification_record["_id"]),
+        image1_face=image1_face,
+        image2_face=image2_face
+    )
+
+
+class VerificationJobQueue:
+    """
+    In-memory priority queue in front of a pool of job worker tasks
+
+    Job state lives in Mongo so any API process can answer polls; the
+    images only live in this queue, so jobs still waiting when the server
+    stops are marked failed rather than silently lost.
+    """
+
+    def __init__(self, workers: int = 0, max_pending: int = 256):
+        self.workers = workers or 2 * inference_executor.workers
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running_jobs: Set[ObjectId] = set()
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}
+        # Ties in priority run in submission order
+        self._sequence = itertools.count()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Verification job queue started with {self.workers} job workers")
+
+    async def stop(self):
+        """Stop the job workers and fail every job that did not finish"""
+        if not self._tasks:
+            return
+        unfinished = list(self._running_jobs)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        while not self._queue.empty():
+            unfinished.append(self._queue.get_nowait()[2])
+        self._running_jobs.clear()
+        await fail_verification_jobs(unfinished, "Server stopped before the job finished, please resubmit")
+        if unfinished:
+            logger.warning(f"Marked {len(unfinished)} unfinished verification jobs as failed")
+        logger.info("Verification job queue stopped")
+
+    async def submit(self, user_id: str, uploads: tuple, priority: int = 0) -> dict:
+        """
+        Store a queued job and hand it to the job workers
+
+        Higher priorities run first.
+
+        Raises:
+            JobQueueFull: if max_pending jobs are already waiting
+        """
+        if not self._tasks:
+            await self.start()
+        if self._queue.qsize() >= self.max_pending:
+            self._rejected += 1
+            raise JobQueueFull("Verification job queue is full")
+
+        (image1_path, _), (image2_path, _) = uploads
+        job = await create_verification_job(user_id, image1_path.name, image2_path.name, priority)
+        self._queue.put_nowait((-priority, next(self._sequence), job["_id"], user_id, uploads))
+        self._submitted += 1
+        return job
+
+    async def wait_for_change(self, job_id: str, timeout: float):
+        """Return when this process updates the job, or after timeout"""
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Also runs when an SSE client disconnects mid-wait; the last
+            # waiter drops the event so finished or abandoned jobs leave nothing behind
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                self._changed.pop(job_id, None)
+
+    def _notify(self, job_id: ObjectId):
+        event = self._changed.pop(str(job_id), None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self):
+        while True:
+            _, _, job_id, user_id, uploads = await self._queue.get()
+            self._running_jobs.add(job_id)
+            try:
+                await self._run(job_id, user_id, uploads)
+            except Exception as e:
+                logger.error(f"Verification job {job_id} could not be updated: {e}")
+            finally:
+                self._running_jobs.discard(job_id)
+                self._notify(job_id)
+
+    async def _run(self, job_id: ObjectId, user_id: str, uploads: tuple):
+        await update_verification_job(job_id, status="running", started_at=datetime.utcnow())
+        self._notify(job_id)
+
+        try:
+            while True:
+                try:
+                    async with admission.admit(user_id, cost=0, shed=False):
+                        result = await verify_and_record(user_id, uploads)
+                    break
+                except InferenceQueueFull:
+                    # Jobs can wait, interactive requests get the inference queue first
+                    await asyncio.sleep(BUSY_RETRY_DELAY)
+        except Exception as e:
+            self._failed += 1
+            logger.error(f"Verification job {job_id} failed: {e}")
+            await update_verification_job(
+                job_id, status="failed", error=f"Verification failed: {e}", finished_at=datetime.utcnow()
+            )
+            return
+
+        self._completed += 1
+        await update_verification_job(
+            job_id, status="done", result=result.model_dump(), finished_at=datetime.utcnow()
+        )
+        if settings.PERSIST_UPLOADS:
+            await run_in_threadpool(save_uploads, *uploads)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "active": len(self._running_jobs),
+            "max_pending": self.max_pending,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+        }
+
+
+verification_jobs = VerificationJobQueue(
+    workers=settings.JOB_WORKERS,
+    max_pending=settings.JOB_QUEUE_SIZE,
+)
@@ -1,14 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from typing import List , Dict, Any
-import shutil
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List , Dict, Any, Optional
 from pathlib import Path
+from contextlib import contextmanager
+import json
 import uuid
+import zipfile
 import logging
-from ..schemas import VerificationResult
+from ..schemas import AgeEstimate, MultiFrameResult, VerificationJob, VerificationResult, VerificationStats
 from ..models import UserInDB, VerificationResponse
 from ..auth.utils import get_current_user
-from ..database import create_verification_record, get_user_verification_history, delete_user_verification_history
-from ..ml.model_loader import verify_faces
+from ..database import (
+    get_user_verification_history, delete_user_verification_history,
+    iter_user_verification_history, encode_history_cursor, decode_history_cursor, HISTORY_FIELDS,
+    get_verification_job, get_verification_stats, create_verification_record
+)
+from ..ml.pipeline import face_summary, get_face, get_face_age
+from ..ml.multiframe import verify_clip_async, verify_frames_async
+from ..ml.age import age_enabled
+from ..ml.backends import verification_threshold
+from ..metrics import stage
+from ..admission import AdmissionRejected, admission
+from ..uploads import CLIP_SIGNATURES, ImageRejected, check_image_bytes, probe_clip, read_upload, save_uploads
+from ..ml.executor import InferenceQueueFull, InferenceTimeout
+from .batch import BatchError, parse_manifest, run_batch
+from .jobs import FINISHED_STATUSES, JobQueueFull, verification_jobs, verify_and_record
+from .stats import summarize_stats
 from ..config import settings
 
 logger = logging.getLogger(__name__)
@@ -20,6 +38,9 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 MAX_FILE_SIZE = settings.MAX_FILE_SIZE
 
+# Seconds between job re-reads (and keep-alive comments) on an SSE stream
+JOB_EVENTS_INTERVAL = 1.0
+
 def validate_image(file: UploadFile):
     """Validate uploaded image"""
     file_ext = Path(file.filename).suffix.lower()
@@ -29,91 +50,404 @@ def validate_image(file: UploadFile):
             detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
 
+async def read_image_upload(file: UploadFile) -> bytes:
+    """Validate and read an uploaded image, rejecting bad ones before any decoding"""
+    validate_image(file)
+    try:
+        return await read_upload(file)
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{file.filename}: {e}")
+
+def upload_paths(user_id: str, image1: UploadFile, image2: UploadFile, image1_bytes: bytes, image2_bytes: bytes) -> tuple:
+    """(path, bytes) for each image of a pair, under a fresh id in UPLOAD_DIR"""
+    unique_id = str(uuid.uuid4())
+    return (
+        (UPLOAD_DIR / f"{user_id}_{unique_id}_1{Path(image1.filename).suffix}", image1_bytes),
+        (UPLOAD_DIR / f"{user_id}_{unique_id}_2{Path(image2.filename).suffix}", image2_bytes),
+    )
+
+def job_response(job: dict) -> VerificationJob:
+    return VerificationJob(job_id=str(job["_id"]), **{k: v for k, v in job.items() if k in VerificationJob.model_fields})
+
+@contextmanager
+def inference_errors():
+    """Translate admission and inference executor errors into HTTP errors"""
+    try:
+        yield
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except InferenceQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Verification service is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    except InferenceTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Verification timed out"
+        )
+
 @router.post("/", response_model=VerificationResult)
 async def verify_images(
+    background_tasks: BackgroundTasks,
     image1: UploadFile = File(...),
     image2: UploadFile = File(...),
     current_user: UserInDB = Depends(get_current_user)
 ):
     """Verify if two face images belong to the same person"""
-    validate_image(image1)
-    validate_image(image2)
+    with stage("upload_read"):
+        image1_bytes = await read_image_upload(image1)
+        image2_bytes = await read_image_upload(image2)
     
     user_id = str(current_user.id)
-    unique_id = str(uuid.uuid4())
-    
-    image1_ext = Path(image1.filename).suffix
-    image2_ext = Path(image2.filename).suffix
-    
-    image1_filename = f"{user_id}_{unique_id}_1{image1_ext}"
-    image2_filename = f"{user_id}_{unique_id}_2{image2_ext}"
-    
-    image1_path = UPLOAD_DIR / image1_filename
-    image2_path = UPLOAD_DIR / image2_filename
+    uploads = upload_paths(user_id, image1, image2, image1_bytes, image2_bytes)
     
     try:
-        # Save uploaded files
-        with open(image1_path, "wb") as buffer:
-            shutil.copyfileobj(image1.file, buffer)
-        
-        with open(image2_path, "wb") as buffer:
-            shutil.copyfileobj(image2.file, buffer)
-        
+        # Images are decoded straight from the request body, nothing touches disk
         logger.info(f"Verifying faces for user {user_id}")
         
-        # Perform verification
-        result, confidence = verify_faces(str(image1_path), str(image2_path))
+        # Perform verification in the worker processes so the event loop stays free
+        with inference_errors():
+            async with admission.admit(user_id):
+                verification = await verify_and_record(user_id, uploads)
         
-        # Save to database
-        verification_record = await create_verification_record(
-            user_id=user_id,
-            image1_filename=image1_filename,
-            image2_filename=image2_filename,
-            result=result,
-            confidence_score=confidence
-        )
+        logger.info(f"Verification complete: {verification.result}, confidence: {verification.confidence_score:.4f}")
         
-        message = (
-            f"Same person detected! (Confidence: {confidence:.2%})" 
-            if result == "match" 
-            else f"Different persons detected. (Confidence: {confidence:.2%})"
-        )
+        # Keep a copy of the uploads for auditing without delaying the response
+        if settings.PERSIST_UPLOADS:
+            background_tasks.add_task(save_uploads, *uploads)
         
-        logger.info(f"Verification complete: {result}, confidence: {confidence:.4f}")
+        return verification
         
-        # Return proper response
-        return VerificationResult(
-            result=result,
-            confidence_score=confidence,
-            message=message,
-            verification_id=str(verification_record["_id"])  # Fix: Access _id from dict
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Verification error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Verification failed: {str(e)}"
+        )
+
+async def read_clip_upload(clip: UploadFile) -> tuple:
+    """
+    Read an animated GIF/PNG clip and count its frames without decoding them
+
+    Returns:
+        tuple: (bytes, frame count)
+    """
+    try:
+        data = await read_upload(clip, settings.MULTIFRAME_MAX_REQUEST_SIZE, CLIP_SIGNATURES)
+        _, _, _, frame_count = await run_in_threadpool(probe_clip, data)
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{clip.filename}: {e}")
+    return data, frame_count
+
+@router.post("/frames", response_model=MultiFrameResult)
+async def verify_frames(
+    background_tasks: BackgroundTasks,
+    reference: UploadFile = File(...),
+    frames: List[UploadFile] = File([]),
+    clip: Optional[UploadFile] = File(None),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Verify a sequence of selfie frames, or a short clip, against a reference image
+    
+    Send either several `frames` (JPEG/PNG) or one `clip` (animated GIF or
+    PNG). Uploaded frames are encoded one by one in coarse-to-fine order; a
+    clip is walked forward once in a single worker. Either way sampling
+    stops as soon as the running mean distance is clearly on one side of
+    the threshold, so most requests only decode a few frames.
+    """
+    if bool(frames) == bool(clip):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Send either frames or a clip"
         )
+    if frames and len(frames) > settings.MULTIFRAME_MAX_FRAMES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.MULTIFRAME_MAX_FRAMES} frames are accepted per request"
+        )
+    
+    user_id = str(current_user.id)
+    unique_id = str(uuid.uuid4())
+    with stage("upload_read"):
+        reference_bytes = await read_image_upload(reference)
+        uploads = [(UPLOAD_DIR / f"{user_id}_{unique_id}_ref{Path(reference.filename).suffix}", reference_bytes)]
+        if clip:
+            clip_bytes, frame_count = await read_clip_upload(clip)
+            uploads.append((UPLOAD_DIR / f"{user_id}_{unique_id}_clip{Path(clip.filename).suffix}", clip_bytes))
+        else:
+            frame_bytes = [await read_image_upload(frame) for frame in frames]
+            frame_count = len(frame_bytes)
+            uploads += [
+                (UPLOAD_DIR / f"{user_id}_{unique_id}_frame{index}{Path(frame.filename).suffix}", data)
+                for index, (frame, data) in enumerate(zip(frames, frame_bytes))
+            ]
+    
+    logger.info(f"Verifying {frame_count} frames for user {user_id}")
+    try:
+        with inference_errors():
+            async with admission.admit(user_id):
+                reference_face = await get_face(reference_bytes)
+                if clip:
+                    outcome = await verify_clip_async(reference_face, clip_bytes, frame_count)
+                else:
+                    outcome = await verify_frames_async(
+                        reference_face, frame_count, lambda index: get_face(frame_bytes[index])
+                    )
         
+        with stage("db_insert"):
+            record = await create_verification_record(
+                user_id=user_id,
+                image1_filename=uploads[0][0].name,
+                image2_filename=uploads[1][0].name,
+                result=outcome["result"],
+                confidence_score=outcome["confidence_score"]
+            )
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Verification error: {str(e)}")
-        # Clean up files on error
-        if image1_path.exists():
-            image1_path.unlink()
-        if image2_path.exists():
-            image2_path.unlink()
+        logger.error(f"Multi-frame verification error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Verification failed: {str(e)}"
         )
+    
+    if settings.PERSIST_UPLOADS:
+        background_tasks.add_task(save_uploads, *uploads)
+    
+    checked = f"{outcome['frames_with_face']} of {frame_count} frames checked"
+    message = (
+        f"Same person detected! (Confidence: {outcome['confidence_score']:.2%}, {checked})"
+        if outcome["result"] == "match"
+        else f"Different persons detected. (Confidence: {outcome['confidence_score']:.2%}, {checked})"
+    )
+    return MultiFrameResult(
+        message=message,
+        verification_id=str(record["_id"]),
+        reference_face=face_summary(reference_face),
+        **outcome
+    )
+
+@router.post("/jobs", response_model=VerificationJob, status_code=status.HTTP_202_ACCEPTED)
+async def submit_verification_job(
+    image1: UploadFile = File(...),
+    image2: UploadFile = File(...),
+    priority: int = Form(0, ge=0, le=9),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Queue a verification and return its job id straight away
+    
+    Jobs with a higher priority run first. Follow the job with
+    GET /verify/jobs/{job_id} or the SSE stream at /verify/jobs/{job_id}/events.
+    """
+    with stage("upload_read"):
+        image1_bytes = await read_image_upload(image1)
+        image2_bytes = await read_image_upload(image2)
+    
+    user_id = str(current_user.id)
+    with inference_errors():
+        # Charged now, the job worker then queues fairly without shedding
+        admission.charge(user_id)
+    try:
+        job = await verification_jobs.submit(
+            user_id, upload_paths(user_id, image1, image2, image1_bytes, image2_bytes), priority
+        )
+    except JobQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many verification jobs are waiting, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    logger.info(f"Queued verification job {job['_id']} for user {user_id} (priority {priority})")
+    return job_response(job)
+
+async def get_user_job(job_id: str, current_user: UserInDB) -> dict:
+    job = await get_verification_job(job_id, str(current_user.id))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Verification job not found")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=VerificationJob)
+async def get_job(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Current state of a verification job, with its result once done"""
+    return job_response(await get_user_job(job_id, current_user))
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Server-sent events for a verification job
+    
+    One event per status change, named after the status, with the job as
+    JSON data; the stream ends after the done or failed event.
+    """
+    job = await get_user_job(job_id, current_user)
+    
+    async def stream():
+        nonlocal job
+        last_status = None
+        while True:
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: {last_status}\ndata: {job_response(job).model_dump_json()}\n\n"
+                if last_status in FINISHED_STATUSES:
+                    return
+            else:
+                # Comment line, keeps proxies from closing an idle stream
+                yield ": waiting\n\n"
+            # Woken early when this process updates the job; jobs run by
+            # another API process are picked up by the periodic re-read
+            await verification_jobs.wait_for_change(job_id, JOB_EVENTS_INTERVAL)
+            job = await get_verification_job(job_id, str(current_user.id)) or job
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/batch")
+async def verify_batch(
+    manifest: str = Form(...),
+    archive: Optional[UploadFile] = File(None),
+    images: List[UploadFile] = File([]),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Verify many image pairs in one request
+    
+    The manifest lists pairs of image names; the images come either as a
+    ZIP archive or as multipart files named accordingly. Results are
+    streamed back as NDJSON, one line per pair, in completion order.
+    """
+    try:
+        pairs = parse_manifest(manifest)
+    except BatchError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if archive is not None:
+        try:
+            zip_file = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Archive is not a valid ZIP file")
+        
+        async def read_image(name: str) -> bytes:
+            if zip_file.getinfo(name).file_size > MAX_FILE_SIZE:
+                raise ValueError(f"{name} exceeds the maximum file size")
+            return check_image_bytes(await run_in_threadpool(zip_file.read, name))
+    elif images:
+        uploads = {image.filename: image for image in images}
+        
+        async def read_image(name: str) -> bytes:
+            return await read_upload(uploads[name])
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide the images as a ZIP archive or as multipart files"
+        )
+    
+    user_id = str(current_user.id)
+    with inference_errors():
+        admission.charge(user_id)
+    logger.info(f"Batch verification of {len(pairs)} pairs for user {user_id}")
+    
+    async def stream():
+        async for line in run_batch(pairs, read_image, user_id):
+            yield json.dumps(line) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/estimate-age", response_model=AgeEstimate)
+async def estimate_age(
+    image: UploadFile = File(...),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Estimate the age of the primary face in an image"""
+    if not age_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Age estimation is not enabled on this server"
+        )
+    with stage("upload_read"):
+        image_bytes = await read_image_upload(image)
+    
+    with inference_errors():
+        async with admission.admit(str(current_user.id)):
+            face = await get_face_age(image_bytes)
+    
+    if face["encoding"] is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No face detected in the image")
+    if face["age"] is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Age estimation failed, please retry shortly"
+        )
+    
+    return AgeEstimate(age=face["age"], location=list(face["location"]), faces_found=face["faces_found"])
+
+def parse_history_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Validate a comma-separated field projection"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(requested) - HISTORY_FIELDS
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(HISTORY_FIELDS))}"
+        )
+    return requested
+
+def history_doc_json(doc: dict) -> dict:
+    """Make a history document JSON-serialisable"""
+    doc["_id"] = str(doc["_id"])
+    if "created_at" in doc:
+        doc["created_at"] = doc["created_at"].isoformat()
+    return doc
 
 @router.get("/history")
 async def get_history(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user)
 ):
-    """Get verification history for current user"""
+    """
+    Get verification history for current user, newest first
+    
+    Pages are keyset-paginated: when more records exist, the X-Next-Cursor
+    response header holds the token to pass as `cursor` for the next page.
+    `fields` is a comma-separated projection (e.g. "result,confidence_score").
+    """
+    projection = parse_history_fields(fields)
+    try:
+        after = decode_history_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
     try:
         user_id = str(current_user.id)
         logger.info(f"Fetching history for user: {user_id}")
         
-        history = await get_user_verification_history(user_id, limit)
+        history = await get_user_verification_history(user_id, limit, after=after, fields=projection)
         logger.info(f"Found {len(history)} verification records")
         
+        if len(history) == limit:
+            response.headers["X-Next-Cursor"] = encode_history_cursor(history[-1])
+        
+        for doc in history:
+            # Convert ObjectId to string
+            doc["_id"] = str(doc["_id"])
+        
         return history
     except Exception as e:
         logger.error(f"Error fetching history: {e}")
@@ -124,6 +458,32 @@ async def get_history(
             detail=f"Failed to fetch history: {str(e)}"
         )
 
+@router.get("/history/export")
+async def export_history(
+    fields: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Stream the full verification history as NDJSON, newest first"""
+    projection = parse_history_fields(fields)
+    user_id = str(current_user.id)
+    
+    async def stream():
+        async for doc in iter_user_verification_history(user_id, projection):
+            yield json.dumps(history_doc_json(doc)) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/stats", response_model=VerificationStats)
+async def get_stats(current_user: UserInDB = Depends(get_current_user)):
+    """
+    Match rate, confidence histogram and first/last verification time
+    
+    Read from a summary maintained on every insert, so the cost does not
+    grow with the history. With WRITE_BEHIND enabled, records still queued
+    are counted once they are flushed.
+    """
+    return summarize_stats(await get_verification_stats(str(current_user.id)))
+
 @router.delete("/history", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_history(current_user: UserInDB = Depends(get_current_user)):
     """Delete all verification history for current user"""
@@ -131,11 +491,24 @@ async def delete_history(current_user: UserInDB = Depends(get_current_user)):
     await delete_user_verification_history(user_id)
     return None
 
+@router.get("/admission")
+async def get_admission(current_user: UserInDB = Depends(get_current_user)):
+    """The current user's rate limit tokens and admission counts"""
+    return {
+        "rate": admission.rate,
+        "burst": admission.burst,
+        "estimated_wait": round(admission.estimated_wait(str(current_user.id)), 3),
+        **admission.user_stats(str(current_user.id))
+    }
+
 @router.get("/config")
 async def get_config(current_user: UserInDB = Depends(get_current_user)):
     """Get current verification configuration"""
     return {
-        "threshold": settings.VERIFICATION_THRESHOLD,
+        "threshold": verification_threshold(),
+        "embedding_backend": settings.EMBEDDING_BACKEND,
+        "age_estimation": age_enabled(),
         "allowed_extensions": list(ALLOWED_EXTENSIONS),
-        "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024)
+        "max_file_size_mb": MAX_FILE_SIZE / (1024 * 1024),
+        "max_image_pixels": settings.MAX_IMAGE_PIXELS
     }
\ No newline at end of file
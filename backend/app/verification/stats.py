@@ -0,0 +1,54 @@
+"""
+Per-user verification statistics
+GET /verify/stats reads the summary document that database.py keeps up to
+date on every history insert. Running this module rebuilds all summaries
+from the history collection, e.g. after deploying it on an existing
+database:
+
+    python -m app.verification.stats
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from ..database import (
+    CONFIDENCE_BUCKETS, VERIFICATION_RESULTS, close_mongo_connection, connect_to_mongo, rebuild_verification_stats
+)
+from ..schemas import VerificationStats
+
+
+def summarize_stats(doc: Optional[dict]) -> VerificationStats:
+    """Response for a summary document, all zeros when there is none"""
+    doc = doc or {}
+    total = doc.get("total", 0)
+    results = {result: 0 for result in VERIFICATION_RESULTS}
+    results.update(doc.get("results", {}))
+    histogram = doc.get("confidence_histogram", {})
+
+    return VerificationStats(
+        total=total,
+        results=results,
+        match_rate=results["match"] / total if total else None,
+        mean_confidence=doc["confidence_sum"] / total if total else None,
+        confidence_histogram=[histogram.get(str(bucket), 0) for bucket in range(CONFIDENCE_BUCKETS)],
+        first_verification_at=doc.get("first_at"),
+        last_verification_at=doc.get("last_at"),
+    )
+
+
+async def rebuild():
+    await connect_to_mongo()
+    try:
+        count = await rebuild_verification_stats()
+    finally:
+        await close_mongo_connection()
+    print(f"Rebuilt verification stats for {count} users")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(rebuild())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Write-behind buffer for verification records
+Records are queued in memory and inserted with insert_many once enough
+have accumulated or the flush interval passes, so request latency no
+longer includes a Mongo round trip. Nothing is dropped: a full queue makes
+callers wait, and records that still cannot be queued or inserted are
+spilled to local disk and replayed on the next start.
+"""
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from .config import settings
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+def _only_duplicates(error: BulkWriteError) -> bool:
+    write_errors = error.details.get("writeErrors", [])
+    return all(e.get("code") == 11000 for e in write_errors) and not error.details.get("writeConcernErrors")
+
+
+def _inserted(batch: List[dict], error: BulkWriteError) -> List[dict]:
+    """Documents of an unordered insert_many that were stored despite the error"""
+    failed = {e["index"] for e in error.details.get("writeErrors", [])}
+    return [document for index, document in enumerate(batch) if index not in failed]
+
+
+def _retryable(batch: List[dict], error: BulkWriteError) -> List[dict]:
+    """Documents that failed for a reason other than already being stored"""
+    failed = {e["index"] for e in error.details.get("writeErrors", []) if e.get("code") != 11000}
+    return [document for index, document in enumerate(batch) if index in failed]
+
+
+def _claimable(path: Path) -> bool:
+    """Whether a spill file being replayed was left behind by a process that is gone"""
+    _, _, owner = path.suffix.partition("-")
+    if not owner.isdigit() or int(owner) == os.getpid():
+        return True
+    try:
+        os.kill(int(owner), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+class WriteBehindBuffer:
+    """Bounded queue of documents flushed to one collection in batches"""
+
+    def __init__(
+        self,
+        collection: str,
+        max_queue: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        put_timeout: float = 1.0,
+        spill_dir: str = "spill",
+        max_attempts: int = 3,
+        on_flush: Optional[Callable[[List[dict]], Awaitable]] = None,
+    ):
+        self.collection = collection
+        # Called once per batch after it is stored, e.g. to update summaries
+        self.on_flush = on_flush
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.spill_dir = Path(spill_dir)
+        self.max_attempts = max_attempts
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._flushed = 0
+        self._batches = 0
+        self._spilled = 0
+        self._replayed = 0
+        self._failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """Start the background flusher and replay records spilled by a previous run"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        await self._replay_spill()
+        logger.info(f"Write-behind buffer for {self.collection} started")
+
+    async def stop(self):
+        """Flush every queued record and stop the flusher"""
+        if self._task is None:
+            return
+        # The flusher finishes the batch it holds rather than being cancelled
+        # mid-insert, which could leave an insert committed but unaccounted for
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+        while not self._queue.empty():
+            await self._flush(self._drain(self.batch_size))
+        logger.info(f"Write-behind buffer for {self.collection} flushed and stopped")
+
+    async def put(self, document: dict):
+        """Queue a document, waiting up to put_timeout for room before spilling it"""
+        try:
+            await asyncio.wait_for(self._queue.put(document), self.put_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Write-behind queue for {self.collection} is full, spilling to disk")
+            self._spill([document])
+
+    def _drain(self, limit: int) -> List[dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _next(self, timeout: Optional[float]) -> Optional[dict]:
+        """Next queued document, None after timeout or once stop() was called"""
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        get = asyncio.ensure_future(self._queue.get())
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        done, _ = await asyncio.wait({get, stopping}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if get in done:
+            return get.result()
+        # A cancelled get leaves its document in the queue for stop() to drain
+        get.cancel()
+        return None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            first = await self._next(None)
+            if first is None:
+                break
+            deadline = time.monotonic() + self.flush_interval
+            batch = [first]
+
+            # Collect until the batch is full, the flush interval has passed or stop() is called
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                document = await self._next(remaining)
+                if document is None:
+                    break
+                batch.append(document)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        if not batch:
+            return
+        from .database import get_database
+
+        inserted, pending = [], batch
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with stage("db_flush"):
+                    await get_database()[self.collection].insert_many(pending, ordered=False)
+                inserted += pending
+                pending = []
+                break
+            except Exception as e:
+                if isinstance(e, BulkWriteError):
+                    # Unordered insert: everything outside writeErrors is stored,
+                    # duplicates were stored by an earlier attempt or replay
+                    inserted += _inserted(pending, e)
+                    pending = _retryable(pending, e)
+                    if _only_duplicates(e) or not pending:
+                        break
+                self._failures += 1
+                logger.error(f"Flushing {len(pending)} records to {self.collection} failed (attempt {attempt}): {e}")
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        else:
+            self._spill(pending)
+
+        if not inserted:
+            return
+        self._flushed += len(inserted)
+        self._batches += 1
+        # Records stored by an earlier attempt were already summarised then
+        if self.on_flush is not None:
+            await self.on_flush(inserted)
+
+    def _spill(self, documents: List[dict]):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"{self.collection}-{os.getpid()}.jsonl"
+        with open(path, "a") as f:
+            for document in documents:
+                f.write(json_util.dumps(document) + "\n")
+        self._spilled += len(documents)
+
+    async def _replay_spill(self):
+        if not self.spill_dir.exists():
+            return
+
+        # Files another worker is replaying are skipped, leftovers of a
+        # crashed replay are picked up again
+        leftovers = [path for path in self.spill_dir.glob(f"{self.collection}-*.replaying*") if _claimable(path)]
+        for path in sorted(list(self.spill_dir.glob(f"{self.collection}-*.jsonl")) + leftovers):
+            replaying = path.with_suffix(f".replaying-{os.getpid()}")
+            try:
+                os.replace(path, replaying)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            with open(replaying) as f:
+                documents = [json_util.loads(line) for line in f if line.strip()]
+            for start in range(0, len(documents), self.batch_size):
+                await self._flush(documents[start:start + self.batch_size])
+            replaying.unlink()
+            self._replayed += len(documents)
+            logger.info(f"Replayed {len(documents)} spilled records from {path.name}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "flushed": self._flushed,
+            "batches": self._batches,
+            "failures": self._failures,
+            "spilled": self._spilled,
+            "replayed": self._replayed,
+        }
+
+
+async def _update_verification_stats(records: List[dict]):
+    from .database import update_verification_stats
+    await update_verification_stats(records)
+
+
+verification_writer = WriteBehindBuffer(
+    "verification_history",
+    max_queue=settings.WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=settings.WRITE_BEHIND_FLUSH_MS / 1000,
+    spill_dir=settings.WRITE_BEHIND_SPILL_DIR,
+    on_flush=_update_verification_stats,
+)
@@ -0,0 +1,63 @@
+"""
+Compare two benchmark result files
+
+Prints the relative change of every throughput and latency figure and
+exits non-zero when any figure got worse by more than --tolerance.
+
+Usage (from backend/):
+    python -m benchmarks.compare baseline.json candidate.json --tolerance 0.1
+"""
+import argparse
+import json
+import sys
+from typing import Iterator, Tuple
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def figures(report: dict) -> Iterator[Tuple[str, str, float]]:
+    """(name, metric, value) for every comparable number in a report"""
+    for stage, summary in report.get("stages", {}).items():
+        for key in LATENCY_KEYS:
+            yield f"stage {stage}", key, summary[key]
+
+    for endpoint, levels in report.get("endpoints", {}).items():
+        for summary in levels:
+            name = f"{endpoint} c={summary['concurrency']}"
+            for key in ("throughput_rps",) + LATENCY_KEYS:
+                if key in summary:
+                    yield name, key, summary[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown (default: 0.1)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    before = {(name, key): value for name, key, value in figures(baseline)}
+    regressions = 0
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+    for name, key, value in figures(candidate):
+        old = before.get((name, key))
+        if not old:
+            continue
+        change = (value - old) / old
+        # Higher throughput is better, higher latency is worse
+        regressed = change > args.tolerance if key != "throughput_rps" else change < -args.tolerance
+        regressions += regressed
+        print(f"{'!' if regressed else ' '} {name:18s} {key:15s} {old:10.3f} -> {value:10.3f} ({change:+.1%})")
+
+    if regressions:
+        print(f"{regressions} figure(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Offline fixtures for the benchmarks
+Face images are generated by jittering seed photos (scikit-image's bundled
+astronaut by default), so every request carries distinct bytes and the
+embedding cache only helps where a benchmark asks for it. Mongo is replaced
+by mongomock-motor unless a real URL is given.
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def configure_environment(mongo_url: Optional[str] = None):
+    """Settings the app needs, set before anything under app/ is imported"""
+    os.environ.setdefault("MONGODB_URL", mongo_url or "mongodb://localhost:27017")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-not-for-production")
+    os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="bench-uploads-"))
+    os.environ.setdefault("PERSIST_UPLOADS", "false")
+    # One benchmark user drives all the load: no per-user rate limit or shedding
+    os.environ.setdefault("ADMISSION_RATE", "0")
+    os.environ.setdefault("ADMISSION_MAX_WAIT", "3600")
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+
+def load_seed_faces(faces_dir: Optional[str] = None) -> List[np.ndarray]:
+    """RGB arrays to derive benchmark images from"""
+    if faces_dir:
+        paths = sorted(p for p in Path(faces_dir).iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+        if not paths:
+            raise SystemExit(f"No .jpg/.png images in {faces_dir}")
+        return [np.array(Image.open(p).convert("RGB")) for p in paths]
+
+    try:
+        from skimage import data
+    except ImportError:
+        raise SystemExit("Install scikit-image or pass --faces DIR with your own face photos")
+    return [data.astronaut()]
+
+
+def generate_images(seeds: List[np.ndarray], count: int, size: int = 640, seed: int = 0) -> List[bytes]:
+    """
+    `count` distinct JPEGs of roughly size x size
+
+    Each one is a random crop, scale, brightness and mirror of a seed face,
+    which keeps the face detectable while changing every byte.
+    """
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        source = Image.fromarray(seeds[i % len(seeds)])
+        width, height = source.size
+        margin = rng.uniform(0, 0.06)
+        box = (
+            int(width * rng.uniform(0, margin)),
+            int(height * rng.uniform(0, margin)),
+            int(width * (1 - rng.uniform(0, margin))),
+            int(height * (1 - rng.uniform(0, margin))),
+        )
+        image = source.crop(box)
+        scale = size / max(image.size) * rng.uniform(0.9, 1.1)
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR)
+        image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.85, 1.15))
+        if rng.random() < 0.5:
+            image = image.transpose(Image.FLIP_LEFT_RIGHT)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=rng.randint(85, 95))
+        images.append(buffer.getvalue())
+    return images
+
+
+def use_mongo_stand_in():
+    """Point connect_to_mongo at an in-memory mongomock-motor client"""
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("Install mongomock-motor or pass --mongo-url for a local mongod")
+
+    from app import database
+    from app import main
+
+    async def connect_to_mongo():
+        database.mongodb.client = AsyncMongoMockClient()
+        await database.ensure_indexes()
+
+    database.connect_to_mongo = connect_to_mongo
+    main.connect_to_mongo = connect_to_mongo
@@ -0,0 +1,140 @@
+"""
+Closed-loop load against the in-process app
+A fixed number of client coroutines each send their next request as soon
+as the previous one returns, through httpx's ASGI transport, so the numbers
+include routing, validation, auth and serialisation but no network.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+import numpy as np
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> dict:
+    """Throughput and latency percentiles in milliseconds"""
+    samples = np.asarray(latencies) * 1000
+    if len(samples) == 0:
+        return {"requests": 0, "errors": errors, "elapsed_s": elapsed, "throughput_rps": 0.0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+async def run_level(send: Callable[[int], Awaitable], concurrency: int, total: int) -> dict:
+    """Issue `total` requests from `concurrency` clients"""
+    latencies = []
+    errors = 0
+    indices = iter(range(total))
+
+    async def client():
+        nonlocal errors
+        for i in indices:
+            started = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def seed_history(user_id: str, count: int):
+    """Insert `count` verification records for the benchmark user"""
+    from bson import ObjectId
+
+    from app.database import create_verification_records
+
+    now = datetime.utcnow()
+    records = [
+        {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "image1_filename": f"{user_id}_{i}_1.jpg",
+            "image2_filename": f"{user_id}_{i}_2.jpg",
+            "result": "match" if i % 2 else "no_match",
+            "confidence_score": 0.5,
+            "created_at": now - timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+    for start in range(0, len(records), 1000):
+        await create_verification_records(records[start:start + 1000])
+
+
+async def run_load(images: List[bytes], concurrency_levels: List[int], requests: int, history_records: int) -> Dict[str, list]:
+    """Benchmark /verify/, /auth/login and /verify/history at each concurrency level"""
+    import httpx
+
+    from app.database import get_user_by_username
+    from app.main import app
+
+    results = {"verify": [], "login": [], "history": []}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Models warm up in the background after startup, don't time that
+            while True:
+                readiness = (await client.get("/ready")).json()
+                if readiness["status"] == "ready":
+                    break
+                if readiness["status"] == "failed":
+                    raise SystemExit(f"Model warm-up failed: {readiness['error']}")
+                await asyncio.sleep(0.2)
+            await client.post("/auth/signup", json={"email": "bench@example.com", "username": USERNAME, "password": PASSWORD})
+            response = await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            user = await get_user_by_username(USERNAME)
+            await seed_history(str(user.id), history_records)
+
+            # Unique image pairs per request; the first few also warm the workers
+            cursor = 0
+
+            def next_pair():
+                nonlocal cursor
+                pair = images[cursor % len(images)], images[(cursor + 1) % len(images)]
+                cursor += 2
+                return pair
+
+            async def verify(_):
+                image1, image2 = next_pair()
+                files = {"image1": ("a.jpg", image1, "image/jpeg"), "image2": ("b.jpg", image2, "image/jpeg")}
+                return await client.post("/verify/", files=files, headers=headers)
+
+            async def login(_):
+                return await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+
+            async def history(_):
+                return await client.get("/verify/history", params={"limit": 50}, headers=headers)
+
+            await run_level(verify, 2, 4)
+
+            for concurrency in concurrency_levels:
+                for name, send in (("verify", verify), ("login", login), ("history", history)):
+                    summary = await run_level(send, concurrency, requests)
+                    summary["concurrency"] = concurrency
+                    results[name].append(summary)
+                    print(
+                        f"{name:8s} c={concurrency:<3d} {summary['throughput_rps']:>8.2f} req/s  "
+                        f"p50 {summary.get('p50_ms', 0):8.2f} ms  p99 {summary.get('p99_ms', 0):8.2f} ms  "
+                        f"errors {summary['errors']}"
+                    )
+
+    return results
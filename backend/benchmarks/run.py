@@ -0,0 +1,105 @@
+"""
+Offline benchmark suite for the verification service
+
+Runs the FastAPI app in-process against mongomock-motor (or a local mongod)
+with generated face images, and writes throughput/latency per endpoint and
+concurrency level plus per-stage timings to JSON.
+
+Usage (from backend/):
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run --concurrency 1,4,16 --requests 100 --output bench.json
+    python -m benchmarks.compare baseline.json bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+from .fixtures import BACKEND_DIR, configure_environment, generate_images, load_seed_faces, use_mongo_stand_in
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the face verification API in-process")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts (default: 1,4,16)")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and level (default: 100)")
+    parser.add_argument("--history-records", type=int, default=1000, help="records seeded for /verify/history")
+    parser.add_argument("--image-size", type=int, default=640, help="longest side of generated images")
+    parser.add_argument("--faces", help="directory of seed face photos (default: scikit-image astronaut)")
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--skip-load", action="store_true", help="only run the stage micro-benchmarks")
+    parser.add_argument("--skip-stages", action="store_true", help="only run the endpoint load test")
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_environment(args.mongo_url)
+    if not args.mongo_url:
+        use_mongo_stand_in()
+
+    from app.config import settings
+
+    concurrency_levels = [int(level) for level in args.concurrency.split(",") if level]
+    seeds = load_seed_faces(args.faces)
+    # Two images per verify request, every request at every level gets fresh bytes
+    images = generate_images(seeds, 2 * args.requests * len(concurrency_levels) + 8, args.image_size)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "embedding_backend": settings.EMBEDDING_BACKEND,
+            "inference_workers": settings.INFERENCE_WORKERS,
+            "decode_max_side": settings.DECODE_MAX_SIDE,
+            "detect_max_side": settings.DETECT_MAX_SIDE,
+            "encode_batch_size": settings.ENCODE_BATCH_SIZE,
+            "encode_batch_window_ms": settings.ENCODE_BATCH_WINDOW_MS,
+            "embedding_cache_size": settings.EMBEDDING_CACHE_SIZE,
+            "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+            "write_behind": settings.WRITE_BEHIND,
+        },
+        "parameters": {
+            "concurrency": concurrency_levels,
+            "requests": args.requests,
+            "history_records": args.history_records,
+            "image_size": args.image_size,
+            "mongo": "local" if args.mongo_url else "mongomock",
+        },
+    }
+
+    started = time.perf_counter()
+    if not args.skip_stages:
+        from .stages import run_stages
+        report["stages"] = run_stages(images[:64], settings.ENCODE_BATCH_SIZE)
+
+    if not args.skip_load:
+        from .load import run_load
+        report["endpoints"] = asyncio.run(
+            run_load(images, concurrency_levels, args.requests, args.history_records)
+        )
+    report["duration_s"] = round(time.perf_counter() - started, 2)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmarks of the verify_faces stages
+Each stage runs in this process on the same generated images the load test
+uses, with the decode/detect resolution limits from the current settings.
+"""
+import time
+from typing import Callable, List
+
+import numpy as np
+
+
+def time_calls(fn: Callable, args: list) -> dict:
+    """Call fn once per argument and report per-call latency in milliseconds"""
+    timings = []
+    for arg in args:
+        started = time.perf_counter()
+        fn(arg)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    samples = np.asarray(timings)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "calls": len(samples),
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+    }
+
+
+def run_stages(images: List[bytes], batch_size: int = 16) -> dict:
+    """decode, detect, encode (single and batched) and distance timings"""
+    from app.config import settings
+    from app.ml.model_loader import compare_encodings, crop_face, encode_face_batch
+    from app.ml.preprocess import decode_image, detect_faces, select_face
+
+    decoded = [decode_image(image, settings.DECODE_MAX_SIDE)[0] for image in images]
+    crops = []
+    for image in decoded:
+        locations, scores = detect_faces(image, settings.DETECT_MAX_SIDE)
+        if locations:
+            primary = locations[select_face(locations, scores, image.shape, settings.FACE_SELECTION)]
+            crops.append(crop_face(image, primary))
+    if not crops:
+        raise SystemExit("No faces were detected in the benchmark images")
+
+    encodings = encode_face_batch([crop for crop, _ in crops], [location for _, location in crops])
+    batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+
+    results = {
+        "decode": time_calls(lambda image: decode_image(image, settings.DECODE_MAX_SIDE), images),
+        "detect": time_calls(lambda image: detect_faces(image, settings.DETECT_MAX_SIDE), decoded),
+        "encode": time_calls(lambda crop: encode_face_batch([crop[0]], [crop[1]]), crops),
+        "encode_batch": time_calls(
+            lambda batch: encode_face_batch([crop for crop, _ in batch], [location for _, location in batch]),
+            batches,
+        ),
+        "distance": time_calls(
+            lambda i: compare_encodings(encodings[i], encodings[(i + 1) % len(encodings)]),
+            list(range(len(encodings))) * 100,
+        ),
+    }
+    results["encode_batch"]["batch_size"] = batch_size
+    results["encode_batch"]["per_face_ms"] = round(
+        results["encode_batch"]["mean_ms"] * len(batches) / len(crops), 4
+    )
+
+    for name, summary in results.items():
+        print(f"{name:13s} p50 {summary['p50_ms']:9.3f} ms  p99 {summary['p99_ms']:9.3f} ms")
+    return results